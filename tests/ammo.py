@@ -0,0 +1,122 @@
+import argparse
+import random
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import raw_http
+
+from conftest import get_config, get_maps_from_config_file
+from cpp_server_api import CppServer, ServerException
+
+
+# Виды запросов и их доля в смеси по умолчанию
+DEFAULT_MIX = {'maps': 1, 'map': 2, 'join': 1, 'state': 8, 'action': 8, 'tick': 1}
+TOKEN_KINDS = {'state', 'action'}
+DIRECTIONS = ['L', 'R', 'U', 'D', '']
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parses a mix like "maps=1,state=10,action=10"
+    """
+    result = dict()
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f'Unknown request kind {kind}, expected one of {list(DEFAULT_MIX)}')
+        result[kind] = float(weight or 1)
+    return result
+
+
+def phantom(request: bytes, tag: str) -> bytes:
+    """
+    One bullet of the phantom ammo: the size of the request and the tag, then the request itself
+    """
+    return f'{len(request)} {tag}\n'.encode() + request + b'\r\n'
+
+
+def mint_tokens(server: CppServer, maps: List[dict], players: int) -> List[str]:
+    names = [f'Ammo dog {i}' for i in range(players)]
+    map_ids = [maps[i % len(maps)]['id'] for i in range(players)]
+    return [token for token, _ in server.join_many(names, map_ids)]
+
+
+def make_request(kind: str, host: str, maps: List[dict], tokens: Sequence[str], rnd: random.Random) -> bytes:
+    json_header = {'Content-Type': 'application/json'}
+
+    if kind == 'maps':
+        data, _ = raw_http.encode_request('GET', host, '/api/v1/maps')
+    elif kind == 'map':
+        data, _ = raw_http.encode_request('GET', host, f'/api/v1/maps/{rnd.choice(maps)["id"]}')
+    elif kind == 'join':
+        body = {'userName': f'Ammo dog {rnd.randrange(1_000_000)}', 'mapId': rnd.choice(maps)['id']}
+        data, _ = raw_http.encode_request('POST', host, '/api/v1/game/join', json_header, json_data=body)
+    elif kind == 'state':
+        header = {'Authorization': f'Bearer {rnd.choice(tokens)}'}
+        data, _ = raw_http.encode_request('GET', host, '/api/v1/game/state', header)
+    elif kind == 'action':
+        header = {'Authorization': f'Bearer {rnd.choice(tokens)}', **json_header}
+        body = {'move': rnd.choice(DIRECTIONS)}
+        data, _ = raw_http.encode_request('POST', host, '/api/v1/game/player/action', header, json_data=body)
+    elif kind == 'tick':
+        body = {'timeDelta': rnd.randint(1, 100)}
+        data, _ = raw_http.encode_request('POST', host, '/api/v1/game/tick', json_header, json_data=body)
+    else:
+        raise ValueError(f'Unknown request kind {kind}')
+
+    return data
+
+
+def generate(maps: List[dict], count: int, host: str, mix: Optional[Dict[str, float]] = None,
+             tokens: Sequence[str] = (), seed: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (tag, request) pairs drawn from the weighted mix of request kinds
+    """
+    mix = {kind: weight for kind, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+    if not tokens and TOKEN_KINDS & mix.keys():
+        raise ServerException('State and action requests need tokens, mint them on a running server',
+                              {'mix': mix})
+    if not maps:
+        raise ServerException('There are no maps in the config', {'maps': maps})
+
+    rnd = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    for kind in rnd.choices(kinds, weights, k=count):
+        yield kind, make_request(kind, host, maps, tokens, rnd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generates Yandex.Tank phantom ammo for the maps of the config')
+    parser.add_argument('--config', type=Path, help='Game config, CONFIG_PATH is used by default')
+    parser.add_argument('--output', type=Path, default=Path('ammo.txt'))
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Weights of the request kinds, e.g. "maps=1,map=2,join=1,state=8,action=8,tick=1"')
+    parser.add_argument('--host', default='cppserver:8080', help='Host header of the requests')
+    parser.add_argument('--server', help='Url of a running server to mint the tokens on, e.g. http://127.0.0.1:8080')
+    parser.add_argument('--players', type=int, default=100, help='How many tokens to mint')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    maps = get_maps_from_config_file(args.config) if args.config else get_config()['maps']
+
+    tokens = list()
+    if args.server:
+        host, port = raw_http.split_url(args.server)
+        tokens = mint_tokens(CppServer(host, port), maps, args.players)
+
+    try:
+        bullets = list(generate(maps, args.count, args.host, args.mix, tokens, args.seed))
+    except ServerException as ex:
+        parser.error(ex.message())
+
+    with open(args.output, 'wb') as output:
+        for tag, request in bullets:
+            output.write(phantom(request, tag))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+
+from typing import Optional, Tuple, List, Union
+from urllib.parse import urlencode, urlsplit
+
+from cpp_server_api import CppServer, MAP_LIST_VALIDATOR
+from raw_http import RawResponse, encode_request, read_response_async
+
+
+class AsyncCppServer:
+    """
+    asyncio counterpart of CppServer. Requests go over raw asyncio streams through a bounded pool of keep-alive
+    connections, so a lot of players can act simultaneously
+    """
+
+    assert_type = staticmethod(CppServer.assert_type)
+    assert_fields = staticmethod(CppServer.assert_fields)
+    validate_response = staticmethod(CppServer.validate_response)
+    validate_map = staticmethod(CppServer.validate_map)
+    validate_token = staticmethod(CppServer.validate_token)
+    validate_state = staticmethod(CppServer.validate_state)
+    validate_player_state = staticmethod(CppServer.validate_player_state)
+
+    def __init__(self, server_domain: str, port: Union[str, int] = '8080', max_connections: int = 256):
+        self.url = f'http://{server_domain}:{port}'
+        self.host = server_domain
+        self.port = int(port)
+        self.max_connections = max_connections
+
+        self.__idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = list()
+        self.__slots: Optional[asyncio.Semaphore] = None
+        self.__opened = 0
+        self.__sent = 0
+
+    @staticmethod
+    def from_server(server: CppServer, max_connections: int = 256):
+        parts = urlsplit(server.url)
+        return AsyncCppServer(parts.hostname, parts.port or 80, max_connections)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        idle, self.__idle = self.__idle, list()
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def connection_stats(self) -> dict:
+        return {'opened': self.__opened, 'reused': self.__sent - self.__opened}
+
+    async def __connection(self) -> Tuple[bool, asyncio.StreamReader, asyncio.StreamWriter]:
+        if self.__idle:
+            return True, *self.__idle.pop()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.__opened += 1
+        return False, reader, writer
+
+    async def request(self, method, header, url, **kwargs) -> RawResponse:
+        params = kwargs.get('params')
+        if params:
+            url = f'{url}?{urlencode(params)}'
+        data, request = encode_request(method, f'{self.host}:{self.port}', url, header,
+                                       body=kwargs.get('data'), json_data=kwargs.get('json'))
+
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.max_connections)
+
+        async with self.__slots:
+            while True:
+                reused, reader, writer = await self.__connection()
+                self.__sent += 1
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                    res = await read_response_async(reader, request)
+                except (ConnectionError, OSError):
+                    writer.close()
+                    if reused:
+                        continue    # The server has closed an idle keep-alive connection, try another one
+                    raise
+
+                if res.keep_alive():
+                    self.__idle.append((reader, writer))
+                else:
+                    writer.close()
+                return res
+
+    async def get(self, endpoint) -> RawResponse:
+        return await self.request('GET', None, endpoint)
+
+    async def post(self, endpoint, data) -> RawResponse:
+        return await self.request('POST', None, endpoint, data=data)
+
+    async def get_maps(self) -> Optional[List[dict]]:
+        request = 'api/v1/maps'
+        res = await self.get(request)
+        self.validate_response(res)
+        res_json: List[dict] = res.json()
+        MAP_LIST_VALIDATOR(res_json)
+        return res_json
+
+    async def get_map(self, map_id: str) -> Optional[dict]:
+        request = 'api/v1/maps/' + map_id
+        res = await self.get(request)
+        self.validate_response(res)
+        res_json = res.json()
+        self.validate_map(res_json)
+        return res_json
+
+    async def join(self, player_name: str, map_id: str) -> Tuple[str, int]:
+        request = 'api/v1/game/join'
+        header = {'content-type': 'application/json'}
+        data = {"userName": player_name, "mapId": map_id}
+        res = await self.request('POST', header, request, json=data)
+        return CppServer.parse_join(res)
+
+    async def add_player(self, player_name: str, map_id: str) -> Tuple[str, int]:
+        return await self.join(player_name, map_id)
+
+    async def get_state(self, token: str) -> Optional[dict]:
+        request = '/api/v1/game/state'
+        header = {'content-type': 'application/json',
+                  'Authorization': f'Bearer {token}'}
+
+        res = await self.request('GET', header, request)
+        return CppServer.parse_state(res)
+
+    async def get_player_state(self, token: str, player_id: int) -> Optional[dict]:
+        game_session_state = await self.get_state(token)
+        return CppServer.extract_player_state(game_session_state, player_id)
+
+    async def move(self, token: str, direction: str):
+        request = '/api/v1/game/player/action'
+        header = {'content-type': 'application/json', 'Authorization': f'Bearer {token}'}
+        data = {"move": direction}
+        res = await self.request('POST', header, request, json=data)
+        self.validate_response(res)
+
+    async def tick(self, ticks: int):
+        request = 'api/v1/game/tick'
+        header = {'content-type': 'application/json'}
+        data = {"timeDelta": ticks}
+        res = await self.request('POST', header, request, json=data)
+        self.validate_response(res)
@@ -1,20 +1,157 @@
+import atexit
+import multiprocessing.util
 import os
 import json
 import pathlib
+import shutil
+import tempfile
+import threading
 
 import pytest
 
 from xprocess import ProcessStarter
 from pathlib import Path
 from contextlib import contextmanager
-from typing import Set
+from typing import Optional, Set
 
+import isolation
+import latency
+import traffic
 
 from cpp_server_api import CppServer as Server
 from cpp_server_api import ServerException
+from cpp_server_api import READINESS_HTTP, PROBE_ENDPOINT
+from resources import ResourceSampler
+from server_pool import ServerPool
 
 START_PATTERN = '[Ss]erver (has )?started'
 
+# Пул заранее запущенных контейнеров для docker_server, DOCKER_POOL_SIZE=0 выключает его
+SERVER_POOL = None
+
+# pytest-parallel запускает тесты в дочерних процессах, а sessionfinish вызывается только в родительском.
+# Дети сохраняют свои гистограммы в этот каталог, родитель их объединяет
+LATENCY_PARTS_DIR = 'LATENCY_PARTS_DIR'
+LATENCY_PARENT_PID = 'LATENCY_PARENT_PID'
+_latency_part_lock = threading.Lock()
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'readiness(mode): how docker_server decides the server has started, '
+                                       '"http" (probe an endpoint) or "log" (wait for the start pattern)')
+    if not hasattr(config, 'workerinput'):
+        os.environ[LATENCY_PARTS_DIR] = tempfile.mkdtemp(prefix='latency.')
+        os.environ[LATENCY_PARENT_PID] = str(os.getpid())
+    if 'SERVER_BINARY' in os.environ and Server.PORT_PLACEHOLDER not in os.environ.get('SERVER_ARGS', ''):
+        pin_single_worker(config)
+
+
+def pin_single_worker(config):
+    """
+    A binary without "{port}" in SERVER_ARGS always binds the same port: parallel tests would collide and the readiness
+    probe could be answered by the server of another worker. pytest-parallel is limited to one test at a time
+    """
+    if getattr(config.option, 'numprocesses', None) not in (None, 0, 1):
+        raise pytest.UsageError('SERVER_BINARY without "{port}" in SERVER_ARGS can\'t run under pytest-xdist -n')
+    if getattr(config.option, 'workers', None) not in (None, '1') or \
+            getattr(config.option, 'tests_per_worker', None) not in (None, '1'):
+        config.option.workers = '1'
+        config.option.tests_per_worker = '1'
+        config.issue_config_time_warning(pytest.PytestConfigWarning(
+            'SERVER_ARGS has no "{port}", the tests of SERVER_BINARY run in one worker'), stacklevel=2)
+
+
+def pytest_addoption(parser):
+    parser.addoption('--latency-report', default=os.environ.get('LATENCY_REPORT', 'latency.json'),
+                     help='Where to save the client-side latency histograms of the session (JSON)')
+
+
+def pytest_sessionstart(session):
+    if not hasattr(session.config, 'workerinput'):
+        isolation.reap()
+
+
+def pytest_collection_finish(session):
+    """
+    Starts the pool containers of the collected docker_server tests in the background before the first test, with the
+    images and readiness modes of those tests. The children of pytest-parallel are forked after this with pools of
+    their own, they fill them on the first checkout
+    """
+    if session.config.option.collectonly or session.config.pluginmanager.has_plugin('parallelrunner'):
+        return
+    items = [item for item in session.items if 'docker_server' in getattr(item, 'fixturenames', ())]
+    pool = get_server_pool() if items else None
+    if pool is None:
+        return
+    configurations = dict()
+    for item in items:
+        image_name, extra_kwargs = get_docker_server_args(item)
+        configurations.setdefault(ServerPool.key(image_name, **extra_kwargs), (image_name, extra_kwargs))
+    for image_name, extra_kwargs in configurations.values():
+        pool.prefill(image_name, **extra_kwargs)
+
+
+def pytest_sessionfinish(session):
+    if SERVER_POOL is not None:
+        close_server_pool(SERVER_POOL)
+
+    workeroutput = getattr(session.config, 'workeroutput', None)
+    if workeroutput is not None:    # pytest-xdist worker: the controller merges and saves the histograms
+        workeroutput['latency'] = latency.RECORDER.to_dict()
+        return
+    merge_latency_parts()
+    if latency.RECORDER:
+        latency.RECORDER.dump(session.config.getoption('latency_report'))
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    output = getattr(node, 'workeroutput', {}).get('latency')
+    if output:
+        latency.RECORDER.merge(latency.LatencyRecorder.from_dict(output))
+
+
+def is_forked_worker() -> bool:
+    """
+    Whether this is a child process of pytest-parallel, xdist workers report through workeroutput instead
+    """
+    parent = os.environ.get(LATENCY_PARENT_PID)
+    return parent is not None and parent != str(os.getpid()) and 'PYTEST_XDIST_WORKER' not in os.environ
+
+
+def pytest_runtest_logfinish():
+    # Дочерний процесс завершается через os._exit, поэтому гистограммы сохраняются после каждого теста
+    if is_forked_worker():
+        dump_latency_part()
+
+
+def dump_latency_part():
+    parts_dir = os.environ.get(LATENCY_PARTS_DIR)
+    if not parts_dir or not os.path.isdir(parts_dir):
+        return
+    path = Path(parts_dir) / f'latency.{os.getpid()}.json'
+    with _latency_part_lock:
+        temporary = path.with_suffix('.tmp')
+        latency.RECORDER.dump(temporary)
+        os.replace(temporary, path)
+
+
+def merge_latency_parts():
+    parts_dir = os.environ.get(LATENCY_PARTS_DIR)
+    if not parts_dir or os.environ.get(LATENCY_PARENT_PID) != str(os.getpid()):
+        return
+    for path in sorted(Path(parts_dir).glob('latency.*.json')):
+        latency.RECORDER.merge(latency.LatencyRecorder.from_dict(json.loads(path.read_text())))
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not latency.RECORDER:
+        return
+    terminalreporter.write_sep('=', 'client latency')
+    for line in latency.RECORDER.summary():
+        terminalreporter.write_line(line)
+
 
 def get_maps_from_config_file(config: Path):
     return json.loads(config.read_text())['maps']
@@ -80,21 +217,139 @@ def server_one_test(xprocess):
         yield result
 
 
-@pytest.fixture(scope='function')
-def docker_server():
-    server_domain = os.environ.get('SERVER_DOMAIN', '127.0.0.1')
-    image_name = os.environ['IMAGE_NAME']
-    port = os.environ.get('SERVER_PORT', '8080')
+def get_readiness(node=None):
+    marker = node.get_closest_marker('readiness') if node is not None else None
+    if marker is not None:
+        return marker.args[0]
+    return os.environ.get('READINESS', READINESS_HTTP)
+
+
+def get_probe_endpoint():
+    return os.environ.get('READINESS_ENDPOINT', PROBE_ENDPOINT)
 
-    extra_kwargs = {}
+
+def get_docker_server_args(node=None):
+    extra_kwargs = {
+        'readiness': get_readiness(node),
+        'probe_endpoint': get_probe_endpoint(),
+    }
 
     if 'ENTRYPOINT' in os.environ:
         extra_kwargs['entrypoint'] = os.environ['ENTRYPOINT']
     if 'CONTAINER_ARGS' in os.environ:
         extra_kwargs['container_args'] = os.environ['CONTAINER_ARGS'].split(' ')
-    server = Server(server_domain, port, image_name, start_pattern=START_PATTERN, **extra_kwargs)
+    return os.environ['IMAGE_NAME'], extra_kwargs
+
+
+def make_docker_server(image_name: str, **extra_kwargs) -> Server:
+    server_domain = os.environ.get('SERVER_DOMAIN', '127.0.0.1')
+    port = os.environ.get('SERVER_PORT', '8080')
+    return Server(server_domain, port, image_name, start_pattern=START_PATTERN, **extra_kwargs)
+
+
+def get_server_pool():
+    """
+    The pool of this process, DOCKER_POOL_SIZE containers per configuration, each is used by DOCKER_POOL_MAX_USES tests
+    """
+    global SERVER_POOL
+    size = int(os.environ.get('DOCKER_POOL_SIZE', '2'))
+    if size <= 0 or 'IMAGE_NAME' not in os.environ or 'SERVER_BINARY' in os.environ:
+        return None
+    if SERVER_POOL is None or SERVER_POOL.pid != os.getpid():
+        # Заполняется в pytest_collection_finish, иначе при первом checkout конфигурацией этого теста
+        SERVER_POOL = ServerPool(make_docker_server, size, int(os.environ.get('DOCKER_POOL_MAX_USES', '1')))
+        # Дочерние процессы pytest-parallel не вызывают sessionfinish и завершаются через os._exit
+        atexit.register(close_server_pool, SERVER_POOL)
+        multiprocessing.util.Finalize(None, close_server_pool, args=(SERVER_POOL, ), exitpriority=10)
+    return SERVER_POOL
+
+
+def close_server_pool(pool: ServerPool):
+    # Обработчики наследуются форкнутыми процессами, чужой пул не трогаем
+    if pool.pid == os.getpid():
+        pool.close()
+
+
+def make_process_server(request=None) -> Server:
+    """
+    Runs SERVER_BINARY without docker with SERVER_ARGS, the paths in them are of this host. The binary has to accept
+    the port as an argument: "{port}" in SERVER_ARGS is replaced with a free port of the test, otherwise SERVER_PORT
+    (8080 by default) is used and the tests run in one worker, see pin_single_worker. SERVER_WRAPPER,
+    e.g. "perf record -g --", is prepended to the command
+    """
+    if 'SERVER_ARGS' not in os.environ:
+        # CONTAINER_ARGS не подходят: в них пути внутри образа
+        pytest.fail(f'SERVER_ARGS is not given: the arguments of SERVER_BINARY={os.environ["SERVER_BINARY"]} with '
+                    f'the paths of this host and "{{port}}" for the port are required', pytrace=False)
+    command = os.environ.get('SERVER_WRAPPER', '').split()
+    command.append(os.environ['SERVER_BINARY'])
+    command.extend(os.environ['SERVER_ARGS'].split())
+    return Server.start_process(command, os.environ.get('SERVER_PORT'), START_PATTERN,
+                                get_readiness(request.node if request is not None else None),
+                                get_probe_endpoint(), cwd=os.environ.get('SERVER_CWD'))
+
 
-    return server
+@pytest.fixture(scope='function')
+def docker_server(request):
+    if 'SERVER_BINARY' in os.environ:
+        server = make_process_server(request)
+        record_traffic(server, request)
+        yield server
+        server.stop_process()
+        return
+
+    image_name, extra_kwargs = get_docker_server_args(request.node)
+    pool = get_server_pool()
+    if pool is None:
+        server = make_docker_server(image_name, **extra_kwargs)
+    else:
+        server = pool.checkout(image_name, **extra_kwargs)
+    record_traffic(server, request)
+
+    yield server
+
+    if pool is not None:
+        pool.checkin(server, **extra_kwargs)
+
+
+def record_traffic(server, request):
+    """
+    Records the requests of the test to TRAFFIC_RECORD_DIR/<test name>.jsonl, if the directory is given
+    """
+    record_dir = os.environ.get('TRAFFIC_RECORD_DIR')
+    if not record_dir:
+        return
+    server.recorder = traffic.TrafficRecorder(Path(record_dir) / f'{get_file_name(request)}.jsonl')
+    request.addfinalizer(server.recorder.close)
+
+
+def get_file_name(request) -> str:
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in request.node.name)
+
+
+@pytest.fixture(scope='function')
+def resource_sampler(request):
+    """
+    sampler = resource_sampler(server) samples the container or the process of the server every RESOURCE_INTERVAL
+    seconds until the end of the test. The time series are saved to RESOURCE_DIR/<test name>.json, if it's given
+    """
+    samplers = list()
+
+    def start(server, interval: Optional[float] = None) -> ResourceSampler:
+        interval = interval or float(os.environ.get('RESOURCE_INTERVAL', '0.5'))
+        sampler = ResourceSampler.for_server(server, interval)
+        samplers.append(sampler)
+        return sampler.start()
+
+    yield start
+
+    record_dir = os.environ.get('RESOURCE_DIR')
+    for i, sampler in enumerate(samplers):
+        sampler.stop()
+        print(sampler.summary())
+        if record_dir:
+            suffix = f'.{i}' if i else ''
+            sampler.save(Path(record_dir) / f'{get_file_name(request)}{suffix}.json')
 
 
 def get_config():
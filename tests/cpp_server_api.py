@@ -1,15 +1,27 @@
 import json
 import os
 import re
+import signal
+import subprocess
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
 import docker
 import docker.errors
 
 import requests
+import requests.adapters
+
+from urllib.parse import urljoin, urlencode, urlsplit
+from typing import Optional, Tuple, List, Union, Type, KeysView, Any, Callable, Dict, Sequence
+
+import isolation
+import json_codec
+import latency
+import raw_http
 
-from urllib.parse import urljoin
-from typing import Optional, Tuple, List, Union, Type, KeysView, Any
+from log_follower import LogFollower
 
 
 class ServerException(Exception):
@@ -111,16 +123,368 @@ class PortIsAllocated(ServerException):
     """
 
 
+class BulkError(ServerException):
+    """
+    Some operations of a bulk call have failed. Keeps the results of the successful ones and the error of each failed
+    """
+
+    def __init__(self, results: List[Any], errors: Dict[int, Exception]):
+        super().__init__(f'{len(errors)} of {len(results)} operations have failed',
+                         {str(index): repr(error) for index, error in errors.items()})
+        self.__results = results
+        self.__errors = errors
+        self.args = results, errors
+
+    def results(self) -> List[Any]:
+        return self.__results
+
+    def errors(self) -> Dict[int, Exception]:
+        return self.__errors
+
+
+# Компилятор схем: правила проверки JSON-ответов превращаются в готовые функции-валидаторы один раз, при импорте.
+# Каждый валидатор принимает проверяемый объект и бросает те же исключения, что и CppServer.assert_*
+
+Validator = Callable[[Any], None]
+
+
+def compile_type(obj_name: str, expected_types: Union[Type, List[Type]]) -> Validator:
+    if type(expected_types) not in {list, tuple, set}:
+        expected_types = [expected_types]
+    expected_types = list(expected_types)
+    allowed = frozenset(expected_types)
+
+    def validate(obj):
+        if type(obj) not in allowed:
+            raise WrongType(obj_name, expected_types, type(obj))
+
+    validate.allowed_types = allowed   # Allows other compilers to inline the check
+    validate.fail = lambda obj: WrongType(obj_name, expected_types, type(obj))
+    return validate
+
+
+def compile_fields(object_name: str, expected_keys: Union[list, str, KeysView]) -> Validator:
+    if type(expected_keys) == str:
+        expected_keys = [expected_keys]
+    expected_keys = tuple(expected_keys)
+
+    def validate(obj):
+        given_keys = obj.keys()
+        for key in expected_keys:
+            if key not in given_keys:
+                raise WrongFields(object_name, list(expected_keys), list(given_keys))
+
+    return validate
+
+
+def compile_all(*validators: Validator) -> Validator:
+    if len(validators) == 1:
+        return validators[0]
+
+    def validate(obj):
+        for validator in validators:
+            validator(obj)
+
+    return validate
+
+
+def compile_field(key: str, validator: Validator) -> Validator:
+    allowed = getattr(validator, 'allowed_types', None)
+    if allowed is not None:
+        fail = validator.fail
+
+        def validate(obj):
+            value = obj[key]
+            if type(value) not in allowed:
+                raise fail(value)
+
+        return validate
+
+    def validate(obj):
+        validator(obj[key])
+
+    return validate
+
+
+def compile_optional_field(key: str, validator: Validator) -> Validator:
+    def validate(obj):
+        if key in obj:
+            validator(obj[key])
+
+    return validate
+
+
+def compile_items(validator: Validator) -> Validator:
+    allowed = getattr(validator, 'allowed_types', None)
+    if allowed is not None:
+        fail = validator.fail
+
+        def validate(obj):
+            for item in obj:
+                if type(item) not in allowed:
+                    raise fail(item)
+
+        return validate
+
+    def validate(obj):
+        for item in obj:
+            validator(item)
+
+    return validate
+
+
+def compile_entries(key_validator: Validator, value_validator: Validator) -> Validator:
+    def validate(obj):
+        for key, value in obj.items():
+            key_validator(key)
+            value_validator(value)
+
+    return validate
+
+
+def compile_each_field(make_validator: Callable[[str], Validator]) -> Validator:
+    """
+    Validates every field of an object, the validator for each field name is made once, on the first occurrence.
+    The made validator gets the whole object
+    """
+    validators = dict()
+
+    def validate(obj):
+        for key in obj:
+            validator = validators.get(key)
+            if validator is None:
+                validator = validators[key] = make_validator(key)
+            validator(obj)
+
+    return validate
+
+
+def compile_predicate(check: Callable[[Any], bool], make_error: Callable[[Any], Exception]) -> Validator:
+    def validate(obj):
+        if not check(obj):
+            raise make_error(obj)
+
+    return validate
+
+
+NUMBER = [float, int]
+DIRECTIONS = ['R', 'L', 'U', 'D', '']
+ROAD_KEYS = ({'x0', 'y0', 'x1'}, {'x0', 'y0', 'y1'})
+
+
+def _building_field(field: str) -> Validator:
+    validator = compile_field(field, compile_type(f'Building field {field}', NUMBER))
+    if field not in ['w', 'h']:
+        return validator
+    return compile_all(validator,
+                       compile_predicate(lambda building: building[field] > 0,
+                                         lambda building: DataInconsistency('Building size is\'t positive',
+                                                                            {'building': building})))
+
+
+MAP_LIST_VALIDATOR = compile_all(
+    compile_type('Map list', list),
+    compile_items(compile_all(
+        compile_fields('Map', ['id', 'name']),
+        compile_field('id', compile_type('Map id', str)),
+        compile_field('name', compile_type('Map name', str)),
+    )),
+)
+
+ROAD_VALIDATOR = compile_all(
+    compile_type('Road', dict),
+    compile_predicate(lambda road: road.keys() == ROAD_KEYS[0] or road.keys() == ROAD_KEYS[1],
+                      lambda road: WrongFields('Road', '["x0", "y0", "x1"] or ["x0", "y0", "y1"]',
+                                               list(road.keys()))),
+    compile_each_field(lambda coordinate: compile_field(coordinate,
+                                                        compile_type(f'Road coordinate {coordinate}', NUMBER))),
+)
+
+BUILDING_VALIDATOR = compile_all(
+    compile_type('Building on the map', dict),
+    compile_fields('Building on the map', ['x', 'y', 'w', 'h']),
+    compile_each_field(_building_field),
+)
+
+OFFICE_FIELDS = {'id': str, 'x': NUMBER, 'y': NUMBER, 'offsetX': NUMBER, 'offsetY': NUMBER}
+
+OFFICE_VALIDATOR = compile_all(
+    compile_type('Office', dict),
+    compile_fields('Office on the map', OFFICE_FIELDS.keys()),
+    *(compile_field(field, compile_type(f'Office field {field}', expected))
+      for field, expected in OFFICE_FIELDS.items()),
+)
+
+MAP_FIELDS = {'id': str, 'name': str, 'roads': list, 'buildings': list, 'offices': list}
+
+MAP_VALIDATOR = compile_all(
+    compile_fields('Map', MAP_FIELDS.keys()),
+    *(compile_field(key, compile_type(key, expected)) for key, expected in MAP_FIELDS.items()),
+    compile_optional_field('dogSpeed', compile_all(
+        compile_type('dogSpeed', float),
+        compile_predicate(lambda dog_speed: dog_speed >= 0,
+                          lambda dog_speed: DataInconsistency('Dog speed can\'t be negative',
+                                                              {'dog speed': dog_speed})),
+    )),
+    compile_field('roads', compile_items(ROAD_VALIDATOR)),
+    compile_field('buildings', compile_items(BUILDING_VALIDATOR)),
+    compile_field('offices', compile_items(OFFICE_VALIDATOR)),
+)
+
+PLAYER_STATE_FIELDS = {'pos': list, 'speed': list, 'dir': str}
+
+PLAYER_STATE_VALIDATOR = compile_all(
+    compile_type('player_id', dict),
+    compile_fields('Player state', PLAYER_STATE_FIELDS.keys()),
+    *(compile_field(key, compile_type(key, expected)) for key, expected in PLAYER_STATE_FIELDS.items()),
+    compile_field('pos', compile_items(compile_type('Player position', float))),
+    compile_field('speed', compile_items(compile_type('Player speed', float))),
+    compile_field('dir', compile_predicate(lambda direction: direction in DIRECTIONS,
+                                           lambda direction: UnexpectedData('Player direction', DIRECTIONS,
+                                                                            direction))),
+)
+
+_PLAYERS_VALIDATOR = compile_all(
+    compile_type('Game state, players', dict),
+    compile_entries(compile_type('Player id', [str, int]), PLAYER_STATE_VALIDATOR),
+)
+
+STATE_VALIDATOR = compile_all(
+    compile_type('Game state', dict),
+    lambda state: _PLAYERS_VALIDATOR(state.get('players')),
+)
+
+
+class ApiResponse:
+    """
+    Wrapper over requests.Response that decodes the JSON body lazily and only once, with the fastest available codec
+    """
+
+    def __init__(self, response: requests.Response):
+        self.__response = response
+        self.__json = None
+        self.__decoded = False
+
+    def json(self) -> Any:
+        if not self.__decoded:
+            self.__json = json_codec.loads(self.__response.content)
+            self.__decoded = True
+        return self.__json
+
+    def unwrap(self) -> requests.Response:
+        return self.__response
+
+    def __getattr__(self, name):
+        return getattr(self.__response, name)
+
+    def __bool__(self):
+        return bool(self.__response)
+
+    def __iter__(self):
+        return iter(self.__response)
+
+    def __repr__(self):
+        return repr(self.__response)
+
+
+READINESS_HTTP = 'http'
+READINESS_LOG = 'log'
+PROBE_ENDPOINT = '/api/v1/maps'
+
+
+def probe_http(url: str, endpoint: str = PROBE_ENDPOINT, timeout: float = 0.5) -> bool:
+    """
+    Whether the server answers the request to the endpoint with any HTTP response
+    """
+    host, port = raw_http.split_url(url)
+    try:
+        with raw_http.connect(host, port, timeout) as sock, sock.makefile('rb') as stream:
+            data, request = raw_http.encode_request('GET', f'{host}:{port}', endpoint, {'Connection': 'close'})
+            sock.sendall(data)
+            raw_http.read_response(stream, request)
+            return True
+    except (OSError, ValueError):
+        return False
+
+
+def wait_for_server(url: str,
+                    container=None,
+                    start_pattern: Optional[str] = '[Ss]erver (has )?started',
+                    readiness: str = READINESS_HTTP,
+                    endpoint: str = PROBE_ENDPOINT,
+                    timeout: float = 3.0,
+                    first_delay: float = 0.001,
+                    max_delay: float = 0.25,
+                    follower: Optional[LogFollower] = None):
+    """
+    Waits with exponential backoff until the server is ready. In the http mode the endpoint is probed, the start
+    pattern in the container logs is only checked as a fallback when the time is out. In the log mode only the logs
+    are checked, with a follower of the logs no polling is needed
+    """
+    if readiness == READINESS_LOG and follower is not None:
+        if follower.search(start_pattern, timeout) is not None:
+            return
+        raise ServerException('Cannot get the right start phrase from the container.', {'logs': follower.text()})
+
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    logs = ''
+
+    while True:
+        if readiness == READINESS_LOG:
+            logs = container.logs().decode()
+            if re.search(start_pattern, logs) is not None:
+                return
+        elif probe_http(url, endpoint, min(1.0, timeout)):
+            return
+
+        if time.monotonic() >= deadline:
+            if readiness != READINESS_LOG and follower is not None and start_pattern is not None:
+                logs = follower.text()
+                if re.search(start_pattern, logs) is not None:
+                    return
+            elif readiness != READINESS_LOG and container is not None and start_pattern is not None:
+                logs = container.logs().decode()
+                if re.search(start_pattern, logs) is not None:
+                    return
+            if readiness == READINESS_LOG:
+                raise ServerException('Cannot get the right start phrase from the container.', {'logs': logs})
+            raise ServerException('The server doesn\'t answer the readiness probe.',
+                                  {'url': url, 'endpoint': endpoint, 'logs': logs})
+
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
 class CppServer:
 
+    # Максимальное число одновременно открытых keep-alive соединений с сервером
+    POOL_SIZE = 32
+    # Число потоков для массовых операций (join_many, move_many, states_many)
+    BULK_WORKERS = 16
+    # Сколько секунд get_log ждёт новую строку лога
+    LOG_TIMEOUT = 1.0
+    # Сколько секунд процесс сервера может завершаться после SIGTERM
+    STOP_TIMEOUT = 3.0
+    # Заменяется в аргументах процесса на выбранный свободный порт
+    PORT_PLACEHOLDER = '{port}'
+
     def __init__(self,
                  server_domain: str,
                  port: Union[str, int] = '8080',
                  image: Optional[str] = None,
                  start_pattern: Optional[str] = '[Ss]erver (has )?started',
+                 readiness: str = READINESS_HTTP,
+                 probe_endpoint: str = PROBE_ENDPOINT,
                  **extra_kwargs):
         self.url = f'http://{server_domain}:{port}'
         self.port = port
+        self.session = CppServer.make_session()
+        self.latency = latency.RECORDER
+        self.recorder = None    # traffic.TrafficRecorder, if the requests should be recorded
+        self.logs: Optional[LogFollower] = None
+        self.cursor = 0
+        self.process: Optional[subprocess.Popen] = None
 
         if image is None:
             self.container = None
@@ -128,11 +492,13 @@ class CppServer:
 
         client = docker.from_env()
         inspector = docker.APIClient()
-        docker_network = os.environ.get('DOCKER_NETWORK')
+        docker_network = isolation.worker_network(client)
 
         kwargs = {
             'detach': True,
             'auto_remove': True,
+            # Имя уникально для каждого воркера, чтобы параллельные тесты не пересекались
+            'name': isolation.unique_name(image.split('/')[-1].split(':')[0]),
         }
 
         if 'container_args' in extra_kwargs:
@@ -147,29 +513,17 @@ class CppServer:
 
         try:
             if container_args:
-                self.container = client.containers.run(image, list(container_args), **kwargs)
+                self.container = isolation.run_container(client, image, list(container_args), **kwargs)
             else:
-                self.container = client.containers.run(image, **kwargs)
+                self.container = isolation.run_container(client, image, **kwargs)
             if self.container is None:
                 raise ServerException('Container does not exist', None)
-            pattern = start_pattern
-            logs = self.container.logs().decode()
-            start_time = time.time()
-            while re.search(pattern, logs) is None:
-                time.sleep(1)
-                logs = self.container.logs().decode()
-                current_time = time.time()
-                if current_time - start_time >= 3:
-                    raise ServerException('Cannot get the right start phrase from the container.', {'logs': logs})
-
-            # Для доступа в контейнер по имени нужно переприсвоить ему выданное (100% свободное уникальное) имя
-            name = inspector.inspect_container(self.container.id)['Name'][1:]  # Для этого вытаскиваем текущее имя
-            # Присваиваем имя на символ короче, чтобы не получить ошибку, что текущее имя уже занято
-            self.container.rename(name[:-1])
-            self.container.rename(name)     # Присваиваем изначальное имя, чтобы иметь доступ по нему
+            self.logs = LogFollower.from_container(self.container)
+            if readiness == READINESS_LOG:
+                wait_for_server(self.url, self.container, start_pattern, readiness, follower=self.logs)
 
             if docker_network:
-                # Если работаем в сети докера - обращаемся по имени
+                # Если работаем в сети докера - обращаемся по уникальному имени, данному при запуске
                 server_domain = inspector.inspect_container(self.container.id)['Name'][1:]
             else:
                 # Иначе - по IP адресу контейнера
@@ -178,11 +532,13 @@ class CppServer:
             # Переприсваиваем url для запросов
             self.url = f'http://{server_domain}:{port}'
 
+            if readiness != READINESS_LOG:
+                wait_for_server(self.url, self.container, start_pattern, readiness, probe_endpoint,
+                                follower=self.logs)
+
         except docker.errors.APIError:
             self.container = None
 
-        self.cursor = 0
-
     def __enter__(self, **kwargs):
         self.__init__(**kwargs)
 
@@ -190,79 +546,184 @@ class CppServer:
         self.__del__()
 
     def __del__(self):
-        if self.container is not None:
+        session = getattr(self, 'session', None)
+        if session is not None:
+            session.close()
+        if getattr(self, 'container', None) is not None:
             try:
                 self.container.stop()
             except docker.errors.NotFound:
                 pass
+        if getattr(self, 'process', None) is not None:
+            self.stop_process()
+        if getattr(self, 'logs', None) is not None:
+            self.logs.close()
+
+    @staticmethod
+    def start_process(command: Sequence[str],
+                      port: Union[str, int, None] = None,
+                      start_pattern: Optional[str] = '[Ss]erver (has )?started',
+                      readiness: str = READINESS_HTTP,
+                      probe_endpoint: str = PROBE_ENDPOINT,
+                      cwd: Optional[str] = None,
+                      env: Optional[Dict[str, str]] = None):
+        """
+        Runs the server binary as a child process in a process group of its own, stdout and stderr go to the log.
+        PORT_PLACEHOLDER in the arguments is replaced with a free port, otherwise the port must be free
+        """
+        if any(CppServer.PORT_PLACEHOLDER in arg for arg in command):
+            port = port or isolation.free_port('127.0.0.1')
+            command = [arg.replace(CppServer.PORT_PLACEHOLDER, str(port)) for arg in command]
+        else:
+            port = port or 8080
+            isolation.ensure_port_free(port)
 
-    def get_line(self):
-        logs: str = self.container.logs().decode()
-        lines = logs.split('\n')
+        server = CppServer('127.0.0.1', port)
+        server.process = subprocess.Popen(list(command), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                          stdin=subprocess.DEVNULL, cwd=cwd, env=env, start_new_session=True)
+        server.logs = LogFollower.from_pipe(server.process.stdout, os.path.basename(command[0]))
         try:
-            line = lines[self.cursor]
-            self.cursor += 1
-            return line
-        except IndexError:
-            return None
+            wait_for_server(server.url, None, start_pattern, readiness, probe_endpoint, follower=server.logs)
+        except ServerException:
+            server.stop_process()
+            raise
+        return server
+
+    def stop_process(self):
+        """
+        Terminates the whole process group of the server, kills it if it doesn't exit in STOP_TIMEOUT seconds
+        """
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            # Группа может пережить сам сервер, если он запущен через обёртку (sh, perf)
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            process.wait()
+            return
+        try:
+            process.wait(self.STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
 
-    def get_log(self):
-        attempt = 1
-        while attempt <= 3:
-            line = self.get_line()
-            if line is not None:
+    def get_line(self, timeout: float = 0.0) -> Optional[str]:
+        """
+        The next line of the server log, waits for it up to timeout seconds
+        """
+        if self.logs is None:
+            return None
+        line = self.logs.wait_line(self.cursor, timeout)
+        if line is not None:
+            self.cursor += 1
+        return line
+
+    def get_log(self, timeout: Optional[float] = None):
+        """
+        The next non-empty line of the server log as JSON, None if the server doesn't write it in time
+        """
+        deadline = time.monotonic() + (self.LOG_TIMEOUT if timeout is None else timeout)
+        while True:
+            line = self.get_line(max(0.0, deadline - time.monotonic()))
+            if line is None:
+                return None
+            if line.strip():
                 return json.loads(line)
-            attempt += 1
-            time.sleep(0.1)   # In case the server haven't posted logs yet, but will do it soon
-        return None
+
+    @staticmethod
+    def make_session() -> requests.Session:
+        """
+        Session with a keep-alive connection pool, shared by all the requests to the server
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=CppServer.POOL_SIZE)
+        adapter.poolmanager.pool_classes_by_scheme = dict(adapter.poolmanager.pool_classes_by_scheme,
+                                                          http=latency.TimedHTTPConnectionPool)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def connection_stats(self) -> dict:
+        opened = 0
+        sent = 0
+        pools = self.session.get_adapter(self.url).poolmanager.pools
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue    # The pool has been evicted in the meantime
+            opened += pool.num_connections
+            sent += pool.num_requests
+        return {'opened': opened, 'reused': sent - opened}
+
+    def send(self, method: str, url: str, **kwargs) -> ApiResponse:
+        req = requests.Request(method, urljoin(self.url, url), **kwargs).prepare()
+        sent_at = time.monotonic()
+        start = time.perf_counter()
+        try:
+            res = self.session.send(req)
+        except requests.RequestException:
+            self.latency.record_request(method, req.url, 'error', time.perf_counter() - start)
+            raise
+        self.latency.record_request(method, req.url, res.status_code, time.perf_counter() - start)
+        res = ApiResponse(res)
+        if self.recorder is not None:
+            self.recorder.record_response(res, sent_at)
+        return res
 
     def request(self, method, header, url, **kwargs):
         try:
-            req = requests.Request(method, urljoin(self.url, url), headers=header, **kwargs).prepare()
-            with requests.Session() as session:
-                return session.send(req)
+            return self.send(method, url, headers=header, **kwargs)
         except Exception as ex:
             print(ex)
 
     def get(self, endpoint):
-        return requests.get(urljoin(self.url, endpoint))
+        return self.send('GET', endpoint)
 
     def post(self, endpoint, data):
-        return requests.post(urljoin(self.url, endpoint), data)
+        return self.send('POST', endpoint, data=data)
+
+    def batch(self, window: int = 64):
+        """
+        Context that queues API calls and sends them pipelined over one connection on exit
+        """
+        return Batch(self, window)
 
     def get_maps(self) -> Optional[List[dict]]:
         request = 'api/v1/maps'
         res: requests.Response = self.get(request)
         self.validate_response(res)
         res_json: List[dict] = res.json()
-
-        CppServer.assert_type('Map list', list, res_json)
-
-        for m in res_json:
-            CppServer.assert_fields('Map', ['id', 'name'], m.keys())
-            CppServer.assert_type('Map id', str, m['id'])
-            CppServer.assert_type('Map name', str, m['name'])
-
+        MAP_LIST_VALIDATOR(res_json)
         return res_json
 
     def get_map(self, map_id: str) -> Optional[dict]:
         request = 'api/v1/maps/' + map_id
         res: requests.Response = self.get(request)
         self.validate_response(res)
-        self.validate_map(res.json())
-        return res.json()
+        res_json = res.json()
+        self.validate_map(res_json)
+        return res_json
 
     def join(self, player_name: str, map_id: str) -> Tuple[str, int]:
         request = 'api/v1/game/join'
         header = {'content-type': 'application/json'}
         data = {"userName": player_name, "mapId": map_id}
         res = self.request('POST', header, request, json=data)
+        return CppServer.parse_join(res)
+
+    @staticmethod
+    def parse_join(res) -> Tuple[str, int]:
         res_json: dict = res.json()
 
         CppServer.assert_fields('Join game response', ['authToken', 'playerId'], res_json.keys())
 
         token = res_json['authToken']
-        self.validate_token(token)
+        CppServer.validate_token(token)
 
         player_id = res_json['playerId']
         CppServer.assert_type('Player id', int, player_id)
@@ -280,27 +741,34 @@ class CppServer:
                   'Authorization': f'Bearer {token}'}
 
         res = self.request('GET', header, request)
-        self.validate_response(res)
+        return CppServer.parse_state(res)
+
+    @staticmethod
+    def parse_state(res) -> Optional[dict]:
+        CppServer.validate_response(res)
         res_json = res.json()
-        self.validate_state(res_json)
+        CppServer.validate_state(res_json)
         return res_json
 
     def get_player_state(self, token: str, player_id: int) -> Optional[dict]:
         game_session_state = self.get_state(token)
+        return CppServer.extract_player_state(game_session_state, player_id)
 
-        self.assert_type('Game session state', dict, game_session_state)
-        self.assert_fields('Game session state', 'players', game_session_state.keys())
+    @staticmethod
+    def extract_player_state(game_session_state: dict, player_id: int) -> Optional[dict]:
+        CppServer.assert_type('Game session state', dict, game_session_state)
+        CppServer.assert_fields('Game session state', 'players', game_session_state.keys())
 
         players = game_session_state.get('players')
 
-        self.assert_type('Players state', dict, players)
+        CppServer.assert_type('Players state', dict, players)
         state = players.get(str(player_id))
 
         if state is None:
             raise DataInconsistency('Game state doesn\'t have the given player id',
                                     {'player_id': players, 'game_state': game_session_state})
 
-        self.validate_player_state(state)
+        CppServer.validate_player_state(state)
 
         return state
 
@@ -318,6 +786,60 @@ class CppServer:
         res = self.request('POST', header, request, json=data)
         self.validate_response(res)
 
+    def run_many(self, operation: Callable, arguments: Sequence[tuple], workers: Optional[int] = None) -> List[Any]:
+        """
+        Runs the operation for every tuple of arguments on a bounded pool of threads.
+        Returns the results in the order of the arguments or raises BulkError if some of the operations have failed
+        """
+        if not arguments:
+            return list()
+        workers = min(workers or CppServer.BULK_WORKERS, len(arguments))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(operation, *args) for args in arguments]
+
+        results = list()
+        errors = dict()
+        for index, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as ex:
+                results.append(None)
+                errors[index] = ex
+
+        if errors:
+            raise BulkError(results, errors)
+        return results
+
+    @staticmethod
+    def zip_args(**columns: Sequence) -> List[tuple]:
+        """
+        Arguments of the calls of run_many, one column per parameter. Columns of different lengths would silently
+        drop calls, so they are an error
+        """
+        lengths = {name: len(column) for name, column in columns.items()}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f'The arguments have different lengths: {lengths}')
+        return list(zip(*columns.values()))
+
+    def join_many(self, player_names: Sequence[str], map_id: Union[str, Sequence[str]],
+                  workers: Optional[int] = None) -> List[Tuple[str, int]]:
+        map_ids = [map_id] * len(player_names) if isinstance(map_id, str) else map_id
+        return self.run_many(self.join, self.zip_args(player_names=player_names, map_ids=map_ids), workers)
+
+    def move_many(self, tokens: Sequence[str], directions: Union[str, Sequence[str]], workers: Optional[int] = None):
+        directions = [directions] * len(tokens) if isinstance(directions, str) else directions
+        self.run_many(self.move, self.zip_args(tokens=tokens, directions=directions), workers)
+
+    def states_many(self, tokens: Sequence[str], player_ids: Optional[Sequence[int]] = None,
+                    workers: Optional[int] = None) -> List[dict]:
+        """
+        Game states for the given tokens or, if the player ids are given, the states of the players
+        """
+        if player_ids is None:
+            return self.run_many(self.get_state, [(token, ) for token in tokens], workers)
+        return self.run_many(self.get_player_state, self.zip_args(tokens=tokens, player_ids=player_ids), workers)
+
     @staticmethod
     def assert_type(obj_name: str, expected_types: Union[Type, List[Type]], obj: any):
         if type(expected_types) not in {list, tuple, set}:
@@ -368,57 +890,7 @@ class CppServer:
 
     @staticmethod
     def validate_map(m: dict):
-        expected = {'id': str, 'name': str, 'roads': list, 'buildings': list, 'offices': list}
-
-        CppServer.assert_fields('Map', expected.keys(), m.keys())
-
-        for key in expected.keys():
-            CppServer.assert_type(key, expected[key], m[key])
-
-        extra = {'dogSpeed': float}
-
-        for key in extra:
-            if key in m.keys():
-                CppServer.assert_type(key, extra[key], m[key])
-
-        dog_speed = m.get('dogSpeed')
-        if dog_speed is not None:
-            if dog_speed < 0:
-                raise DataInconsistency('Dog speed can\'t be negative', {'dog speed': dog_speed})
-
-        for road in m['roads']:
-            road: dict
-            CppServer.assert_type('Road', dict, road)
-
-            if road.keys() != {'x0', 'y0', 'x1'} and road.keys() != {'x0', 'y0', 'y1'}:
-                raise WrongFields('Road', '["x0", "y0", "x1"] or ["x0", "y0", "y1"]', list(road.keys()))
-
-            for coordinate in road:
-                CppServer.assert_type(f'Road coordinate {coordinate}', [float, int], road[coordinate])
-
-        for building in m['buildings']:
-            building: dict
-
-            CppServer.assert_type('Building on the map', dict, building)
-            CppServer.assert_fields('Building on the map', ['x', 'y', 'w', 'h'], building.keys())
-
-            for field in building:
-                CppServer.assert_type(f'Building field {field}', [float, int], building[field])
-                if field in ['w', 'h']:
-                    if building[field] <= 0:
-                        raise DataInconsistency('Building size is\'t positive', {'building': building})
-
-        for office in m['offices']:
-            office: dict
-            CppServer.assert_type('Office', dict, office)
-
-            expected = {'id': str, 'x': [float, int], 'y': [float, int],
-                        'offsetX': [float, int], 'offsetY': [float, int]}
-
-            CppServer.assert_fields('Office on the map', expected.keys(), office.keys())
-
-            for field in expected:
-                CppServer.assert_type(f'Office field {field}', expected[field], office[field])
+        MAP_VALIDATOR(m)
 
     @staticmethod
     def validate_token(token: str):
@@ -429,31 +901,144 @@ class CppServer:
 
     @staticmethod
     def validate_state(res_json: dict):
-        CppServer.assert_type('Game state', dict, res_json)
-        players = res_json.get('players')
-        CppServer.assert_type('Game state, players', dict, players)
-        for player_id in players:
-            CppServer.assert_type('Player id', [str, int], player_id)
-            player: dict = players[player_id]
-
-            CppServer.validate_player_state(player)
+        STATE_VALIDATOR(res_json)
 
     @staticmethod
     def validate_player_state(state: dict):
+        PLAYER_STATE_VALIDATOR(state)
 
-        CppServer.assert_type('player_id', dict, state)
 
-        expected = {'pos': list, 'speed': list, 'dir': str}
-        for key in expected:
-            CppServer.assert_fields(f'Player state', expected.keys(), state.keys())
-            CppServer.assert_type(key, expected[key], state[key])
+class Batch:
+    """
+    HTTP/1.1 pipelined batch of API calls. Every call returns an index into `results` (and `responses`),
+    which are filled in the order of the calls when the context exits. Each response is checked with
+    CppServer.validate_response. Calls left without an answer are resent over a new connection after Connection: close,
+    after a lost connection only GET and HEAD are, a lost POST fails the batch
+    """
+
+    def __init__(self, server: CppServer, window: int = 64):
+        self.server = server
+        self.window = window
+        self.responses: List[raw_http.RawResponse] = list()
+        self.results: List[Any] = list()
+        self.__calls: List[Tuple[bytes, raw_http.RawRequest, Optional[Callable]]] = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.send()
+
+    def __len__(self):
+        return len(self.__calls)
+
+    def request(self, method, header, url, parser: Optional[Callable] = None, **kwargs) -> int:
+        params = kwargs.get('params')
+        if params:
+            url = f'{url}?{urlencode(params)}'
+        host = self.server.url.split('://', 1)[-1]
+        data, request = raw_http.encode_request(method, host, url, header,
+                                                body=kwargs.get('data'), json_data=kwargs.get('json'))
+        self.__calls.append((data, request, parser))
+        return len(self.__calls) - 1
 
-        for coordinate in state['pos']:
-            CppServer.assert_type('Player position', float, coordinate)
-        for coordinate in state['speed']:
-            CppServer.assert_type('Player speed', float, coordinate)
+    def get(self, endpoint) -> int:
+        return self.request('GET', None, endpoint)
 
-        CppServer.assert_type('Player direction', str, state['dir'])
-        expected_dirs = ['R', 'L', 'U', 'D', '']
-        if state['dir'] not in expected_dirs:
-            raise UnexpectedData('Player direction', ['R', 'L', 'U', 'D', ''], state['dir'])
+    def post(self, endpoint, data) -> int:
+        return self.request('POST', None, endpoint, data=data)
+
+    def join(self, player_name: str, map_id: str) -> int:
+        request = 'api/v1/game/join'
+        header = {'content-type': 'application/json'}
+        data = {"userName": player_name, "mapId": map_id}
+        return self.request('POST', header, request, CppServer.parse_join, json=data)
+
+    def get_state(self, token: str) -> int:
+        request = '/api/v1/game/state'
+        header = {'content-type': 'application/json',
+                  'Authorization': f'Bearer {token}'}
+        return self.request('GET', header, request, CppServer.parse_state)
+
+    def get_player_state(self, token: str, player_id: int) -> int:
+        request = '/api/v1/game/state'
+        header = {'content-type': 'application/json',
+                  'Authorization': f'Bearer {token}'}
+        return self.request('GET', header, request,
+                            lambda res: CppServer.extract_player_state(CppServer.parse_state(res), player_id))
+
+    def move(self, token: str, direction: str) -> int:
+        request = '/api/v1/game/player/action'
+        header = {'content-type': 'application/json', 'Authorization': f'Bearer {token}'}
+        data = {"move": direction}
+        return self.request('POST', header, request, json=data)
+
+    def tick(self, ticks: int) -> int:
+        request = 'api/v1/game/tick'
+        header = {'content-type': 'application/json'}
+        data = {"timeDelta": ticks}
+        return self.request('POST', header, request, json=data)
+
+    def send(self) -> List[Any]:
+        responses = list()
+        pending = 0     # Index of the first call without a response
+        sent_at = time.monotonic()
+        started = [0.0] * len(self.__calls)
+
+        while pending < len(self.__calls):
+            answered = sent = pending
+            attempt = time.perf_counter()
+            host, port = raw_http.split_url(self.server.url)
+            try:
+                with raw_http.connect(host, port) as sock, sock.makefile('rb') as stream:
+                    # Не держим в полёте больше window запросов, чтобы не упереться в заполненные буферы сокета
+                    writable = True
+                    while pending < len(self.__calls):
+                        while writable and sent < len(self.__calls) and sent - pending < self.window:
+                            started[sent] = time.perf_counter()
+                            try:
+                                sock.sendall(self.__calls[sent][0])
+                            except ConnectionError:
+                                writable = False    # The answers already received are still read
+                                break
+                            sent += 1
+                        if pending == sent:
+                            raise ConnectionError('Connection closed by the server')
+
+                        request = self.__calls[pending][1]
+                        res = raw_http.read_response(stream, request)
+                        self.server.latency.record_request(request.method, request.url, res.status_code,
+                                                           time.perf_counter() - started[pending])
+                        responses.append(res)
+                        pending += 1
+                        if not res.keep_alive():
+                            break   # The server won't answer the rest, they will be resent over a new connection
+            except ConnectionError as ex:
+                # Отправленный и сброшенный POST мог быть уже выполнен сервером, повторять можно только GET и HEAD.
+                # Ещё не отправленные запросы повторяем, если соединение ответило хоть на один
+                unsafe = [self.__calls[i][1] for i in range(pending, sent)
+                          if self.__calls[i][1].method not in raw_http.IDEMPOTENT_METHODS]
+                if pending == answered or unsafe:
+                    now = time.perf_counter()
+                    for i in range(pending, max(sent, pending + 1)):
+                        request = self.__calls[i][1]
+                        elapsed = now - (started[i] if i < sent else attempt)
+                        self.server.latency.record_request(request.method, request.url, 'error', elapsed)
+                    if unsafe:
+                        calls = ', '.join(f'{request.method} {urlsplit(request.url).path}' for request in unsafe)
+                        raise ConnectionError(f'The connection was lost before the answers to {calls}, they may have '
+                                              f'been applied and are not resent') from ex
+                    raise
+
+        self.responses = responses
+        if self.server.recorder is not None:
+            for res in responses:
+                self.server.recorder.record_response(res, sent_at)
+        self.results = list()
+        for res, (_, _, parser) in zip(responses, self.__calls):
+            CppServer.validate_response(res)
+            self.results.append(res if parser is None else parser(res))
+        self.__calls = list()
+
+        return self.results
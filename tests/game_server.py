@@ -5,8 +5,8 @@ import logging
 import math
 import random
 
-from typing import List, Optional
-from dataclasses import dataclass
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from enum import Enum
 
@@ -29,10 +29,19 @@ class Direction(Enum):
         return random.choice(Direction.__dict__['_member_names_'])
 
 
-@dataclass
 class Point:
-    x: float
-    y: float
+    """
+    A point of the map. Slots instead of a dataclass: sessions of the soak tests keep hundreds of thousands of them
+    """
+
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x: float, y: float):
+        self.x = x
+        self.y = y
+
+    def __repr__(self) -> str:
+        return f'{type(self).__qualname__}(x={self.x!r}, y={self.y!r})'
 
     def __le__(self, other: Point) -> bool:
         return self.x <= other.x and self.y <= other.y
@@ -48,11 +57,18 @@ class Point:
         y = self.y + other.y
         return Point(x, y)
 
+    def __iadd__(self, other: Point) -> Point:
+        self.x += other.x
+        self.y += other.y
+        return self
+
     def __str__(self) -> str:
         return f'[{self.x:.1f}, {self.y:.1f}]'
 
     def __eq__(self, other: Point):
-        return math.isclose(self.x, other.x) and math.isclose(self.y, other.y)
+        # Равные координаты, самый частый случай, проверяем без math.isclose
+        return ((self.x == other.x or math.isclose(self.x, other.x)) and
+                (self.y == other.y or math.isclose(self.y, other.y)))
 
     def to_list(self):
         return [self.x, self.y]
@@ -66,14 +82,23 @@ class Point:
 
 class Vector2D(Point):
 
+    __slots__ = ()
+
     def __mul__(self, other: float) -> Vector2D:
         x = self.x * other
         y = self.y * other
         return Vector2D(x, y)
 
+    def __imul__(self, other: float) -> Vector2D:
+        self.x *= other
+        self.y *= other
+        return self
+
 
 class Road:
 
+    __slots__ = ('left_bottom_corner', 'right_top_corner')
+
     def __init__(self, json_src: dict, width=0.4):
 
         x0, y0 = json_src['x0'], json_src['y0']
@@ -97,15 +122,31 @@ class Road:
         return Point(new_x, new_y)
 
 
-@dataclass
 class Player:
 
-    name: str
-    token: str
-    id: int
-    position: Point
-    speed: Vector2D = Vector2D(0.0, 0.0)
-    direction: Direction = Direction.U
+    __slots__ = ('name', 'token', 'id', 'position', 'speed', 'direction')
+
+    def __init__(self, name: str, token: str, id: int, position: Point, speed: Optional[Vector2D] = None,
+                 direction: Direction = Direction.U):
+        self.name = name
+        self.token = token
+        self.id = id
+        self.position = position
+        # Своя скорость у каждого игрока: общий экземпляр по умолчанию изменялся бы через *=
+        self.speed = Vector2D(0.0, 0.0) if speed is None else speed
+        self.direction = direction
+
+    def __fields(self) -> tuple:
+        return self.name, self.token, self.id, self.position, self.speed, self.direction
+
+    def __repr__(self) -> str:
+        return (f'Player(name={self.name!r}, token={self.token!r}, id={self.id!r}, position={self.position!r}, '
+                f'speed={self.speed!r}, direction={self.direction!r})')
+
+    def __eq__(self, other: Player):
+        if type(other) is not Player:
+            return NotImplemented
+        return self.__fields() == other.__fields()
 
     def set_speed(self, direction: str, speed: float):
         self.speed = get_speed(direction, speed)
@@ -127,10 +168,38 @@ class Player:
         return state
 
     def estimate_new_position(self, ticks: int) -> Point:
-        new_position: Point = self.position + self.speed * (ticks / 1000)
+        # Смещение прибавляется к копии позиции на месте, так создаётся на один объект меньше
+        new_position = Point(self.position.x, self.position.y)
+        new_position += self.speed * (ticks / 1000)
         return new_position
 
 
+class RoadIndex:
+    """
+    Finds the roads containing a point without scanning all of them. Every road is put into the unit cells of the
+    map it covers, a query looks only at the roads of the cell of the point. A cell holds the roads crossing it,
+    so the work doesn't depend on the number or the length of the roads elsewhere
+    """
+
+    def __init__(self, roads: List[Road]):
+        self.roads = roads
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for i, road in enumerate(roads):
+            lo, hi = road.left_bottom_corner, road.right_top_corner
+            for x in range(math.floor(lo.x), math.floor(hi.x) + 1):
+                for y in range(math.floor(lo.y), math.floor(hi.y) + 1):
+                    self.cells[x, y].append(i)
+        self.cells = dict(self.cells)   # Запрос пустой клетки не должен её создавать
+
+    def roads_at(self, point: Point) -> List[Road]:
+        """
+        The roads containing the point in the order of self.roads, as a scan over them would return
+        """
+        # Номера дорог в клетке идут по возрастанию, так как дороги добавлялись по порядку
+        numbers = self.cells.get((math.floor(point.x), math.floor(point.y)), ())
+        return [self.roads[i] for i in numbers if self.roads[i].is_on_the_road(point)]
+
+
 class RoadLoader:
     class RawRoad:
         def __init__(self, dict_src: Optional[dict] = None):
@@ -177,46 +246,56 @@ class RoadLoader:
 
     def handle_the_roads(self):
         RawRoad = RoadLoader.RawRoad
-        RoadPairs = Optional[List[List[RawRoad]]]
-
-        def check_roads(roads: List[RawRoad]) -> RoadPairs:
-            for_merging = list()
-            for i in range(len(roads)):
-                road_1 = roads[i]
-                for road_2 in roads[i+1:]:
-                    # Проверяем совпадение концов коллинеарных дорог
-                    if road_1.is_vertical:
-                        if road_1.x0 == road_2.x0:
-                            if road_1.y0 == road_2.y1 or road_1.y1 == road_2.y0:
-                                for_merging.append([road_1, road_2])
-                    else:
-                        if road_1.y0 == road_2.y0:
-                            if road_1.x0 == road_2.x1 or road_1.x1 == road_2.x0:
-                                for_merging.append([road_1, road_2])
-
-            return for_merging
-
-        def merge_roads(road_1: RawRoad, road_2: RawRoad) -> RawRoad:
-            result = RawRoad()
-            result.x0 = min(road_1.x0, road_2.x0)
-            result.x1 = max(road_1.x1, road_2.x1)
-            result.y0 = min(road_1.y0, road_2.y0)
-            result.y1 = max(road_1.y1, road_2.y1)
-            result.is_vertical = road_1.is_vertical
-
-            return result
-
-        vertical_pairs = check_roads(self.vertical_roads)
-        horizontal_pairs = check_roads(self.horizontal_roads)
-
-        for pair in vertical_pairs:
-            self.new_roads.append(merge_roads(*pair))
-            self.vertical_roads.remove(pair[0])
-            self.vertical_roads.remove(pair[1])
-        for pair in horizontal_pairs:
-            self.new_roads.append(merge_roads(*pair))
-            self.horizontal_roads.remove(pair[0])
-            self.horizontal_roads.remove(pair[1])
+
+        def merge_touching(roads: List[RawRoad]) -> Tuple[List[RawRoad], List[RawRoad]]:
+            """
+            Splits collinear roads into the ones touching no other road and the segments merged from the chains of
+            touching ones, both in the order of their first roads. A road touches the roads starting where it ends
+            on the same line, they are looked up by (line, start) and joined by union-find
+            """
+            def span(road: RawRoad) -> Tuple[int, int, int]:
+                return (road.x0, road.y0, road.y1) if road.is_vertical else (road.y0, road.x0, road.x1)
+
+            parent = list(range(len(roads)))
+
+            def find(i: int) -> int:
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            starts = defaultdict(list)
+            for i, road in enumerate(roads):
+                line, begin, _ = span(road)
+                starts[(line, begin)].append(i)
+            for i, road in enumerate(roads):
+                line, _, end = span(road)
+                for j in starts.get((line, end), ()):
+                    root_i, root_j = find(i), find(j)
+                    # Корень цепочки - её первая дорога, по нему сохраняется порядок
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+            chains = defaultdict(list)
+            for i, road in enumerate(roads):
+                chains[find(i)].append(road)
+
+            single, merged = list(), list()
+            for chain in chains.values():
+                if len(chain) == 1:
+                    single.append(chain[0])
+                    continue
+                result = RawRoad()
+                result.x0 = min(road.x0 for road in chain)
+                result.x1 = max(road.x1 for road in chain)
+                result.y0 = min(road.y0 for road in chain)
+                result.y1 = max(road.y1 for road in chain)
+                result.is_vertical = chain[0].is_vertical
+                merged.append(result)
+            return single, merged
+
+        self.vertical_roads, merged_vertical = merge_touching(self.vertical_roads)
+        self.horizontal_roads, merged_horizontal = merge_touching(self.horizontal_roads)
+        self.new_roads.extend(merged_vertical + merged_horizontal)
 
     def get_dicts(self):
 
@@ -240,14 +319,18 @@ class GameSession:
         for r in prepared_roads:
             road = Road(r)
             self.roads.append(road)
+        self.road_index = RoadIndex(self.roads)
 
         self.players: List[Player] = list()
 
-        self.default_speed = game_map.get('dogSpeed', default_speed)
+        speed = game_map.get('dogSpeed', default_speed)
+        # Скорость в состоянии всегда дробная, как у C++ серверов и VectorSession, даже если в конфиге она целая
+        self.default_speed = None if speed is None else float(speed)
 
-    def add_player(self, name: str, token: str, _id: int, position: Point):
+    def add_player(self, name: str, token: str, _id: int, position: Point) -> Player:
         player = Player(name, token, _id, position)
         self.players.append(player)
+        return player
 
     def get_state(self) -> Optional[dict]:
         state = dict()
@@ -269,11 +352,7 @@ class GameSession:
                 player.set_speed('', 0.0)
 
     def bounded_move(self, start_point: Point, stop_point: Point) -> Optional[Point]:
-        start_roads: List[Road] = list()
-
-        for road in self.roads:
-            if road.is_on_the_road(start_point):
-                start_roads.append(road)
+        start_roads: List[Road] = self.road_index.roads_at(start_point)
 
         if len(start_roads) == 0:
             logging.warning("Player is not on the road. Position: %s, Map: %s", str(start_point), self.map['id'])
@@ -298,6 +377,8 @@ class GameSession:
 
 class GameServer:
 
+    session_class = GameSession
+
     def __init__(self, config_file_name: Path):  # pathlib
         try:
             with open(config_file_name) as f:
@@ -313,6 +394,13 @@ class GameServer:
         self.default_speed = self.config.get('defaultDogSpeed')
 
         self.sessions: List[GameSession] = list()
+        # Индексы вместо перебора карт, сессий и игроков на каждый запрос, пополняются в join
+        self.maps_by_id: Dict[str, dict] = dict()
+        self.sessions_by_map: Dict[str, GameSession] = dict()
+        self.players_by_token: Dict[str, Tuple[GameSession, Player]] = dict()
+        for m in self.config.get('maps', list()):
+            if 'id' in m:
+                self.maps_by_id.setdefault(m['id'], m)  # The first map with the id, as the scan found
 
     def get_maps(self) -> Optional[List[dict]]:
         try:
@@ -325,11 +413,10 @@ class GameServer:
             return list()
 
     def get_map(self, map_id: str) -> Optional[dict]:
-        try:
-            for m in self.config['maps']:
-                if m['id'] == map_id:
-                    return m
-        except KeyError:
+        _map = self.maps_by_id.get(map_id)
+        if _map is not None:
+            return _map
+        if 'maps' not in self.config:
             logging.warning("There is a problem with maps in config. Config: %s", json.dumps(self.config))
             return None
 
@@ -339,39 +426,40 @@ class GameServer:
 
     def join(self, username: str, map_id: str, token: str, player_id: int, position: Point) -> bool:
 
-        for session in self.sessions:
-            session: GameSession
-            if session.map['id'] == map_id:
-                session.add_player(username, token, player_id, position)
-                return True
-
-        _map = self.get_map(map_id)
-        if _map is None:
-            return False
-
-        session = GameSession(_map, self.default_speed)
-        session.add_player(username, token, player_id, position)
-        self.sessions.append(session)
+        session = self.sessions_by_map.get(map_id)
+        if session is None:
+            _map = self.get_map(map_id)
+            if _map is None:
+                return False
+
+            session = self.session_class(_map, self.default_speed)
+            self.sessions.append(session)
+            self.sessions_by_map[map_id] = session
+
+        player = session.add_player(username, token, player_id, position)
+        found = self.players_by_token.get(token)
+        # Повторный токен: как и при переборе, побеждает игрок самой ранней сессии, а в ней самый первый
+        if found is None or self.sessions.index(session) < self.sessions.index(found[0]):
+            self.players_by_token[token] = (session, player)
         return True
 
+    def find_player(self, token: str) -> Optional[Tuple[GameSession, Player]]:
+        return self.players_by_token.get(token)
+
     def get_state(self, token: str) -> Optional[dict]:
-        for session in self.sessions:
-            session: GameSession
-            for player in session.players:
-                player: Player
-                if player.token == token:
-                    return session.get_state()
-        return None
+        found = self.players_by_token.get(token)
+        if found is None:
+            return None
+        session, _ = found
+        return session.get_state()
 
     def move(self, token: str, direction: str) -> bool:
-
-        for session in self.sessions:
-            session: GameSession
-            for player in session.players:
-                if player.token == token:
-                    player.set_speed(direction, session.default_speed)
-                    return True
-        return False    # There is no such player
+        found = self.players_by_token.get(token)
+        if found is None:
+            return False    # There is no such player
+        session, player = found
+        player.set_speed(direction, session.default_speed)
+        return True
 
     def tick(self, ticks: int):
         for session in self.sessions:
@@ -0,0 +1,173 @@
+import atexit
+import itertools
+import multiprocessing.util
+import os
+import re
+import socket
+import threading
+import uuid
+
+from typing import Dict, Optional
+
+import docker
+import docker.errors
+
+import cpp_server_api
+
+
+# Все контейнеры и сети тестов помечаются этими метками, чтобы их можно было найти и удалить после падения
+LABEL = 'cpp-backend-tests'
+PID_LABEL = f'{LABEL}.pid'
+HOST_LABEL = f'{LABEL}.host'
+HOSTNAME = socket.gethostname()
+# Дочерние процессы (pytest-parallel, xdist) наследуют идентификатор сессии через окружение
+SESSION = os.environ.setdefault('TEST_SESSION_ID', uuid.uuid4().hex[:8])
+
+_counter = itertools.count()
+_cleanup_registered = set()
+_lock = threading.Lock()
+
+
+def worker_id() -> str:
+    """
+    gw0, gw1... under pytest-xdist, the process id otherwise (pytest-parallel runs the tests in child processes)
+    """
+    return os.environ.get('PYTEST_XDIST_WORKER') or f'p{os.getpid()}'
+
+
+def labels() -> Dict[str, str]:
+    return {LABEL: SESSION, HOST_LABEL: HOSTNAME, PID_LABEL: str(os.getpid())}
+
+
+def unique_name(prefix: str) -> str:
+    """
+    Container name unique across the workers and the sessions. It's also a valid PostgreSQL database name
+    """
+    prefix = re.sub(r'[^a-z0-9_]', '_', prefix.lower()) or 'server'
+    return f'{prefix}_{SESSION}_{worker_id()}_{next(_counter)}'
+
+
+def free_port(host: str = '') -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def ensure_port_free(port: int, host: str = ''):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, int(port)))
+        except OSError:
+            raise cpp_server_api.PortIsAllocated('The port is already allocated', {'host': host, 'port': port})
+
+
+def is_port_allocated(ex: docker.errors.APIError) -> bool:
+    return 'port is already allocated' in str(ex.explanation or ex)
+
+
+def run_container(client: docker.DockerClient, image: str, command=None, **kwargs):
+    """
+    containers.run with the labels of this process. A taken host port is reported as PortIsAllocated
+    """
+    register_cleanup()
+    kwargs['labels'] = {**labels(), **kwargs.get('labels', {})}
+    try:
+        return client.containers.run(image, command, **kwargs)
+    except docker.errors.APIError as ex:
+        if is_port_allocated(ex):
+            raise cpp_server_api.PortIsAllocated('Docker container can\'t use the given port',
+                                                 {'ports': kwargs.get('ports')})
+        raise
+
+
+def published_port(container, container_port: str) -> int:
+    """
+    Host port docker has chosen for the container port published as {container_port: None}
+    """
+    container.reload()
+    return int(container.attrs['NetworkSettings']['Ports'][container_port][0]['HostPort'])
+
+
+def worker_network(client: Optional[docker.DockerClient] = None) -> Optional[str]:
+    """
+    DOCKER_NETWORK, or with DOCKER_NETWORK_PER_WORKER a network of its own for every worker
+    """
+    base = os.environ.get('DOCKER_NETWORK')
+    if not os.environ.get('DOCKER_NETWORK_PER_WORKER'):
+        return base
+
+    name = f'{base or "cpp_tests"}_{SESSION}_{worker_id()}'
+    client = client or docker.from_env()
+    with _lock:
+        if not client.networks.list(names=[name]):
+            register_cleanup()
+            client.networks.create(name, labels=labels())
+    return name
+
+
+def _remove(client: docker.DockerClient, filters: Dict[str, list]):
+    for container in client.containers.list(all=True, filters=filters):
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+    for network in client.networks.list(filters=filters):
+        try:
+            network.remove()
+        except docker.errors.APIError:
+            pass
+
+
+def cleanup(pid: Optional[int] = None):
+    """
+    Removes the containers and the networks of the process
+    """
+    try:
+        client = docker.from_env()
+        _remove(client, {'label': [f'{PID_LABEL}={pid or os.getpid()}', f'{HOST_LABEL}={HOSTNAME}']})
+    except docker.errors.DockerException:
+        pass
+
+
+def _cleanup_at_exit(pid: int):
+    # Обработчики наследуются форкнутыми процессами, чужие ресурсы не трогаем
+    if pid == os.getpid():
+        cleanup(pid)
+
+
+def register_cleanup():
+    pid = os.getpid()
+    with _lock:
+        if pid in _cleanup_registered:
+            return
+        _cleanup_registered.add(pid)
+    atexit.register(_cleanup_at_exit, pid)
+    # Дочерние процессы multiprocessing завершаются через os._exit и не вызывают atexit
+    multiprocessing.util.Finalize(None, _cleanup_at_exit, args=(pid,), exitpriority=0)
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def reap():
+    """
+    Removes what the crashed test processes of this host have left behind
+    """
+    try:
+        client = docker.from_env()
+        filters = {'label': [LABEL, f'{HOST_LABEL}={HOSTNAME}']}
+        items = client.containers.list(all=True, filters=filters) + client.networks.list(filters=filters)
+        pids = {int((item.attrs.get('Labels') or item.attrs.get('Config', {}).get('Labels') or {}).get(PID_LABEL, 0))
+                for item in items}
+    except docker.errors.DockerException:
+        return
+    for pid in pids:
+        if pid and not is_alive(pid):
+            cleanup(pid)
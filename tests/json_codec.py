@@ -0,0 +1,56 @@
+import json
+import os
+
+from typing import Any, Callable, Dict, Tuple, Union
+
+
+# Декодер и кодировщик для каждого поддерживаемого бэкенда. Быстрые бэкенды подключаются, только если установлены
+BACKENDS: Dict[str, Tuple[Callable[[Union[bytes, str]], Any], Callable[[Any], bytes]]] = {
+    'json': (json.loads, lambda obj: json.dumps(obj).encode()),
+}
+
+try:
+    import orjson
+
+    BACKENDS['orjson'] = (orjson.loads, orjson.dumps)
+except ImportError:
+    pass
+
+try:
+    import ujson
+
+    BACKENDS['ujson'] = (ujson.loads, lambda obj: ujson.dumps(obj).encode())
+except ImportError:
+    pass
+
+PREFERRED_BACKENDS = ['orjson', 'ujson', 'json']
+
+JSONDecodeError = json.JSONDecodeError
+
+backend = 'json'
+_loads, _dumps = BACKENDS['json']
+
+
+def set_backend(name: str):
+    global backend, _loads, _dumps
+    if name not in BACKENDS:
+        raise ValueError(f'JSON backend {name} is not available, installed: {list(BACKENDS)}')
+    backend = name
+    _loads, _dumps = BACKENDS[name]
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    try:
+        return _loads(data)
+    except ValueError:
+        if _loads is json.loads:
+            raise
+        # Fast backends are stricter and report errors differently, the standard library gets the last word
+        return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    return _dumps(obj)
+
+
+set_backend(os.environ.get('JSON_BACKEND') or next(name for name in PREFERRED_BACKENDS if name in BACKENDS))
@@ -0,0 +1,240 @@
+import json
+import math
+import os
+import threading
+import time
+
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of integer values (microseconds). Buckets are log-linear: every power of two is split into
+    equal sub-buckets, so any recorded value is kept with the given number of significant decimal digits
+    """
+
+    def __init__(self, significant_figures: int = 2):
+        self.significant_figures = significant_figures
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self.counts: Dict[int, int] = dict()
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+
+    def __key(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        return (shift << self.sub_bucket_bits) | (value >> shift)
+
+    def __bounds(self, key: int) -> Tuple[int, int]:
+        shift = key >> self.sub_bucket_bits
+        sub_bucket = key & ((1 << self.sub_bucket_bits) - 1)
+        return sub_bucket << shift, ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value: Union[int, float], count: int = 1):
+        value = max(0, int(value))
+        key = self.__key(value)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def record_corrected(self, value: Union[int, float], expected_interval: Union[int, float, None], count: int = 1):
+        """
+        Like recordValueWithExpectedInterval of HdrHistogram: a sender expecting to send every expected_interval
+        couldn't send while waiting for this value, so the values those missed requests would get are recorded too
+        """
+        self.record(value, count)
+        if not expected_interval or expected_interval <= 0:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing, count)
+            missing -= expected_interval
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.total:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.total if self.total else None
+
+    def percentile(self, percent: float) -> Optional[int]:
+        """
+        The highest value equivalent to the bucket holding the given percentile
+        """
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * percent / 100))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self.__bounds(key)[1], self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'significant_figures': self.significant_figures,
+            'count': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean(),
+            'sum': self.sum,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'counts': {str(key): count for key, count in sorted(self.counts.items())},
+        }
+
+    @staticmethod
+    def from_dict(src: dict):
+        histogram = LatencyHistogram(src['significant_figures'])
+        histogram.counts = {int(key): count for key, count in src['counts'].items()}
+        histogram.total = src['count']
+        histogram.min = src['min']
+        histogram.max = src['max']
+        histogram.sum = src['sum']
+        return histogram
+
+
+def endpoint_of(url: str) -> str:
+    """
+    Endpoint name for the url: without the query, identifiers of the maps are replaced with a placeholder
+    """
+    path = urlsplit(url).path or '/'
+    if not path.startswith('/'):
+        path = '/' + path
+    if path.startswith('/api/v1/maps/'):
+        return '/api/v1/maps/{id}'
+    return path
+
+
+class LatencyRecorder:
+    """
+    Thread-safe set of histograms, one per (method and endpoint, status). Connect times are kept separately.
+    Values recorded with an expected interval also go to the histograms corrected for the coordinated omission
+    """
+
+    CONNECT = 'connect'
+
+    def __init__(self, connect_time: bool = False):
+        self.connect_time = connect_time
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = dict()
+        self.corrected: Dict[Tuple[str, str], LatencyHistogram] = dict()
+        self.__lock = threading.Lock()
+
+    def record(self, endpoint: str, status: Union[int, str], seconds: float, expected_interval: Optional[float] = None):
+        key = endpoint, str(status)
+        with self.__lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(seconds * 1_000_000)
+            if expected_interval:
+                histogram = self.corrected.get(key)
+                if histogram is None:
+                    histogram = self.corrected[key] = LatencyHistogram()
+                histogram.record_corrected(seconds * 1_000_000, expected_interval * 1_000_000)
+
+    def record_request(self, method: str, url: str, status: Union[int, str], seconds: float,
+                       expected_interval: Optional[float] = None):
+        self.record(f'{method} {endpoint_of(url)}', status, seconds, expected_interval)
+
+    def record_connect(self, host: str, seconds: float):
+        if self.connect_time:
+            self.record(f'{self.CONNECT} {host}', self.CONNECT, seconds)
+
+    def merge(self, other):
+        with self.__lock:
+            for histograms, other_histograms in (self.histograms, other.histograms), (self.corrected, other.corrected):
+                for key, histogram in other_histograms.items():
+                    if key in histograms:
+                        histograms[key].merge(histogram)
+                    else:
+                        histograms[key] = LatencyHistogram.from_dict(histogram.to_dict())
+
+    def clear(self):
+        with self.__lock:
+            self.histograms.clear()
+            self.corrected.clear()
+
+    def __bool__(self):
+        return bool(self.histograms)
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            endpoints = list()
+            for key, histogram in sorted(self.histograms.items()):
+                item = {'endpoint': key[0], 'status': key[1], **histogram.to_dict()}
+                if key in self.corrected:
+                    item['corrected'] = self.corrected[key].to_dict()
+                endpoints.append(item)
+            return {'endpoints': endpoints}
+
+    @staticmethod
+    def from_dict(src: dict):
+        recorder = LatencyRecorder()
+        for item in src['endpoints']:
+            key = item['endpoint'], item['status']
+            recorder.histograms[key] = LatencyHistogram.from_dict(item)
+            if 'corrected' in item:
+                recorder.corrected[key] = LatencyHistogram.from_dict(item['corrected'])
+        return recorder
+
+    def dump(self, path: Union[str, os.PathLike]):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self) -> List[str]:
+        def ms(value):
+            return '-' if value is None else f'{value / 1000:.2f}'
+
+        header = f'{"endpoint":<40} {"status":>7} {"count":>8} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}'
+        if self.corrected:
+            # CO: corrected for the coordinated omission
+            header += f' {"CO p50 ms":>9} {"CO p90 ms":>9} {"CO p99 ms":>9}'
+        lines = [header]
+        with self.__lock:
+            for key, histogram in sorted(self.histograms.items()):
+                endpoint, status = key
+                line = (f'{endpoint:<40} {status:>7} {histogram.total:>8} '
+                        f'{ms(histogram.percentile(50)):>9} {ms(histogram.percentile(90)):>9} '
+                        f'{ms(histogram.percentile(99)):>9} {ms(histogram.max):>9}')
+                if self.corrected:
+                    corrected = self.corrected.get(key, LatencyHistogram())
+                    line += (f' {ms(corrected.percentile(50)):>9} {ms(corrected.percentile(90)):>9} '
+                             f'{ms(corrected.percentile(99)):>9}')
+                lines.append(line)
+        return lines
+
+
+# Общий для всех CppServer процесса набор гистограмм, его печатает и сохраняет conftest в конце сессии
+RECORDER = LatencyRecorder(connect_time=bool(os.environ.get('LATENCY_CONNECT_TIME')))
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """
+    urllib3 connection reporting the time of establishing the TCP connection to the recorder
+    """
+
+    recorder = RECORDER
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.recorder.record_connect(f'{self.host}:{self.port}', time.perf_counter() - start)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
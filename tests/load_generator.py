@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import errno
+import math
+import os
+import re
+import time
+
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+import raw_http
+from latency import LatencyHistogram
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+SCHEDULE_PATTERN = re.compile(r'(const|line|step)\s*\(([^)]*)\)')
+DURATION_PATTERN = re.compile(r'^\s*([\d.]+)\s*(ms|s|m|h)?\s*$')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}
+
+Bullet = Tuple[str, bytes, str]   # Тег, запрос целиком, метод
+
+
+def parse_duration(text: str) -> float:
+    match = DURATION_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f'Wrong duration {text!r}, expected e.g. 500ms, 30s, 1m')
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def const_times(rps: float, duration: float, offset: float = 0.0) -> Iterator[float]:
+    if rps <= 0:
+        return
+    for i in range(int(rps * duration)):
+        yield offset + i / rps
+
+
+def line_times(rps_from: float, rps_to: float, duration: float, offset: float = 0.0) -> Iterator[float]:
+    """
+    The rate changes linearly, so the i-th request is sent when the integral of the rate reaches i
+    """
+    slope = (rps_to - rps_from) / duration
+    total = int((rps_from + rps_to) / 2 * duration)
+    for i in range(total):
+        if slope == 0:
+            t = i / rps_from
+        else:
+            t = (-rps_from + math.sqrt(rps_from ** 2 + 2 * slope * i)) / slope
+        yield offset + t
+
+
+def step_times(rps_from: float, rps_to: float, step: float, duration: float, offset: float = 0.0) -> Iterator[float]:
+    if step <= 0:
+        raise ValueError(f'Wrong step {step}, it must be positive')
+    rps = rps_from
+    direction = 1 if rps_to >= rps_from else -1
+    while (rps - rps_to) * direction <= 0:
+        yield from const_times(rps, duration, offset)
+        offset += duration
+        rps += step * direction
+
+
+def parse_schedule(text: str) -> Tuple[List[float], float]:
+    """
+    Parses a Yandex.Tank-like schedule, e.g. "line(1, 100, 10s) const(100, 1m) step(100, 500, 100, 10s)".
+    Returns the intended send times (seconds from the start) and the whole duration
+    """
+    times = list()
+    offset = 0.0
+    for kind, args in SCHEDULE_PATTERN.findall(text):
+        args = [arg.strip() for arg in args.split(',')]
+        if kind == 'const':
+            rps, duration = float(args[0]), parse_duration(args[1])
+            times.extend(const_times(rps, duration, offset))
+        elif kind == 'line':
+            rps_from, rps_to, duration = float(args[0]), float(args[1]), parse_duration(args[2])
+            times.extend(line_times(rps_from, rps_to, duration, offset))
+        else:
+            rps_from, rps_to, step, duration = float(args[0]), float(args[1]), float(args[2]), parse_duration(args[3])
+            times.extend(step_times(rps_from, rps_to, step, duration, offset))
+            duration *= math.floor(abs(rps_to - rps_from) / step) + 1
+        offset += duration
+    if not times:
+        raise ValueError(f'Empty schedule {text!r}')
+    return times, offset
+
+
+def read_ammo(path: Union[str, Path]) -> List[Bullet]:
+    """
+    Reads phantom ammo: every bullet is "<size> [tag]\\n" followed by the request of that size
+    """
+    data = Path(path).read_bytes()
+    bullets = list()
+    position = 0
+    while position < len(data):
+        end = data.find(b'\n', position)
+        if end == -1:
+            end = len(data)
+        header = data[position:end].strip()
+        position = end + 1
+        if not header:
+            continue
+        size, _, tag = header.decode().partition(' ')
+        request = data[position:position + int(size)]
+        position += int(size)
+        bullets.append((tag.strip(), request, request.split(b' ', 1)[0].decode()))
+    return bullets
+
+
+class PhoutWriter:
+    """
+    Writes the results in the phout format of Yandex.Tank (times in microseconds):
+    time, tag, interval_real, connect_time, send_time, latency, receive_time, interval_event,
+    size_out, size_in, net_code, proto_code
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory) / f'{time.strftime("%Y-%m-%d_%H-%M-%S")}.{os.getpid()}'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f'phout_{os.getpid()}.log'
+        self.__file = open(self.path, 'w')
+
+    def write(self, timestamp: float, tag: str, interval_real: int, connect_time: int, send_time: int, latency: int,
+              receive_time: int, size_out: int, size_in: int, net_code: int, proto_code: int):
+        self.__file.write(f'{timestamp:.3f}\t{tag}\t{interval_real}\t{connect_time}\t{send_time}\t{latency}\t'
+                          f'{receive_time}\t{latency}\t{size_out}\t{size_in}\t{net_code}\t{proto_code}\n')
+
+    def close(self):
+        self.__file.close()
+
+
+class LoadGenerator:
+    """
+    Open-loop load: requests are sent at the scheduled moments regardless of the answers to the previous ones,
+    by a number of instances, each with its own keep-alive connection. When all the instances are busy requests wait
+    in the queue, so besides interval_real the time since the scheduled moment is kept: the latency corrected for
+    the coordinated omission
+    """
+
+    def __init__(self, host: str, port: int, bullets: List[Bullet], phout: PhoutWriter, instances: int = 100,
+                 timeout: float = 11.0):
+        self.host = host
+        self.port = port
+        self.bullets = bullets
+        self.phout = phout
+        self.instances = instances
+        self.timeout = timeout
+        self.histogram = LatencyHistogram()
+        self.corrected = LatencyHistogram()
+        self.codes = Counter()
+        self.sent = 0
+
+    async def __instance(self, queue: asyncio.Queue):
+        reader = writer = None
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            intended, (tag, data, method) = item
+
+            timestamp = time.time()
+            start = time.perf_counter()
+            connect_time = send_time = latency = receive_time = 0
+            size_in = 0
+            net_code = proto_code = 0
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                            self.timeout)
+                    connect_time = time.perf_counter() - start
+
+                sending = time.perf_counter()
+                writer.write(data)
+                await writer.drain()
+                sent = time.perf_counter()
+                send_time = sent - sending
+
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+                first_byte = time.perf_counter()
+                latency = first_byte - sent
+
+                proto_code, _, headers = raw_http.parse_head(head)
+                request = raw_http.RawRequest(method, '', headers, b'')
+                length = raw_http.body_length(request, proto_code, headers)
+                if length is None:
+                    body = await asyncio.wait_for(reader.read(), self.timeout)
+                    writer.close()
+                    writer = None
+                elif length == -1:
+                    raise ConnectionError(errno.EPROTO, 'Chunked responses are not supported')
+                else:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+                receive_time = time.perf_counter() - first_byte
+                size_in = len(head) + len(body)
+
+                if writer is not None and headers.get('connection', '').lower() == 'close':
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as ex:
+                if isinstance(ex, asyncio.TimeoutError):
+                    net_code = errno.ETIMEDOUT
+                else:
+                    net_code = getattr(ex, 'errno', None) or errno.ECONNRESET
+                proto_code = 0
+                if writer is not None:
+                    writer.close()
+                    writer = None
+
+            interval_real = time.perf_counter() - start
+            self.histogram.record(interval_real * 1_000_000)
+            self.corrected.record((asyncio.get_running_loop().time() - intended) * 1_000_000)
+            self.codes[proto_code or f'net {net_code}'] += 1
+            self.phout.write(timestamp, tag, round(interval_real * 1_000_000), round(connect_time * 1_000_000),
+                             round(send_time * 1_000_000), round(latency * 1_000_000),
+                             round(receive_time * 1_000_000), len(data), size_in, net_code, proto_code)
+
+        if writer is not None:
+            writer.close()
+
+    async def run(self, times: List[float]) -> dict:
+        queue = asyncio.Queue()
+        workers = [asyncio.create_task(self.__instance(queue)) for _ in range(self.instances)]
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i, offset in enumerate(times):
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue.put_nowait((start + offset, self.bullets[i % len(self.bullets)]))
+        self.sent = len(times)
+
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+        elapsed = loop.time() - start
+
+        return {
+            'requests': self.sent,
+            'elapsed': elapsed,
+            'rps': self.sent / elapsed if elapsed else None,
+            'codes': {str(code): count for code, count in self.codes.items()},
+            'p50 ms': self.histogram.percentile(50) / 1000,
+            'p90 ms': self.histogram.percentile(90) / 1000,
+            'p99 ms': self.histogram.percentile(99) / 1000,
+            'corrected p50 ms': self.corrected.percentile(50) / 1000,
+            'corrected p90 ms': self.corrected.percentile(90) / 1000,
+            'corrected p99 ms': self.corrected.percentile(99) / 1000,
+            'phout': str(self.phout.path),
+        }
+
+
+def run(target: str, ammo: Union[str, Path], schedule: str, directory: Union[str, Path],
+        instances: int = 100) -> dict:
+    host, _, port = target.rpartition(':')
+    times, _ = parse_schedule(schedule)
+    phout = PhoutWriter(directory)
+    generator = LoadGenerator(host, int(port), read_ammo(ammo), phout, instances)
+    if uvloop is not None:
+        uvloop.install()
+    try:
+        return asyncio.run(generator.run(times))
+    finally:
+        phout.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Open-loop load generator writing Yandex.Tank phout logs')
+    parser.add_argument('target', help='host:port of the server')
+    parser.add_argument('ammo', type=Path, help='Phantom ammo file')
+    parser.add_argument('--schedule', default='const(100, 10s)',
+                        help='Load profile, e.g. "line(1, 500, 30s) const(500, 1m)" or "step(100, 1000, 100, 10s)"')
+    parser.add_argument('--instances', type=int, default=100, help='How many connections send the requests')
+    parser.add_argument('--directory', type=Path, default=Path(os.environ.get('DIRECTORY', 'logs')),
+                        help='Where to create the directory with phout_*.log, DIRECTORY by default')
+    args = parser.parse_args(argv)
+
+    report = run(args.target, args.ammo, args.schedule, args.directory, args.instances)
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
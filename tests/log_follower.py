@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+
+from typing import BinaryIO, Iterable, List, Optional
+
+
+class LogFollower:
+    """
+    Reads a stream of log chunks in a background thread once and keeps the complete lines. Readers wait for new lines
+    on a condition variable, so nothing is downloaded twice and nobody polls
+    """
+
+    def __init__(self, chunks: Iterable[bytes], name: str = 'log follower'):
+        self.lines: List[str] = list()
+        self.__chunks = chunks
+        self.__partial = b''
+        self.__finished = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__follow, name=name, daemon=True)
+        self.__thread.start()
+
+    @staticmethod
+    def from_container(container):
+        """
+        Follows the logs of a docker container from its start
+        """
+        return LogFollower(container.logs(stream=True, follow=True), f'logs of {container.name}')
+
+    @staticmethod
+    def from_pipe(pipe: BinaryIO, name: str = 'pipe'):
+        """
+        Follows a binary pipe, e.g. stdout of a subprocess.Popen
+        """
+        read = getattr(pipe, 'read1', pipe.read)
+        return LogFollower(iter(lambda: read(65536), b''), f'logs of {name}')
+
+    def __follow(self):
+        try:
+            for chunk in self.__chunks:
+                self.__feed(chunk)
+        except Exception:
+            pass    # The stream is broken when the container or the process is gone, the lines read are kept
+        finally:
+            with self.__condition:
+                if self.__partial:
+                    self.lines.append(self.__partial.decode(errors='replace').rstrip('\r'))
+                    self.__partial = b''
+                self.__finished = True
+                self.__condition.notify_all()
+
+    def __feed(self, chunk: bytes):
+        # Декодируем только целые строки, чтобы не разрезать многобайтовые символы
+        *complete, self.__partial = (self.__partial + chunk).split(b'\n')
+        if not complete:
+            return
+        lines = [line.decode(errors='replace').rstrip('\r') for line in complete]
+        with self.__condition:
+            self.lines.extend(lines)
+            self.__condition.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.__finished
+
+    def wait_line(self, index: int, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        The line with the given index, waits for it up to timeout seconds. None if there is no such line yet
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: len(self.lines) > index or self.__finished, timeout)
+            return self.lines[index] if len(self.lines) > index else None
+
+    def search(self, pattern: str, timeout: Optional[float] = None) -> Optional[re.Match]:
+        """
+        Waits up to timeout seconds for a line matching the pattern
+        """
+        regex = re.compile(pattern)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        with self.__condition:
+            while True:
+                while index < len(self.lines):
+                    match = regex.search(self.lines[index])
+                    if match is not None:
+                        return match
+                    index += 1
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if self.__finished or (remaining is not None and remaining <= 0):
+                    return None
+                self.__condition.wait(remaining)
+
+    def text(self) -> str:
+        with self.__condition:
+            return '\n'.join(self.lines)
+
+    def close(self):
+        close = getattr(self.__chunks, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
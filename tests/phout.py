@@ -0,0 +1,126 @@
+import argparse
+import glob
+import os
+
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from latency import LatencyHistogram
+from load_generator import parse_schedule
+
+
+TANK_INSTANCES = 1000   # phantom.instances по умолчанию
+
+
+class PhoutRecord(NamedTuple):
+    """
+    One line of a Yandex.Tank phout log, times are in microseconds
+    """
+    time: float
+    tag: str
+    interval_real: int
+    connect_time: int
+    send_time: int
+    latency: int
+    receive_time: int
+    interval_event: int
+    size_out: int
+    size_in: int
+    net_code: int
+    proto_code: int
+
+
+def find_phout(directory: Union[str, Path]) -> Path:
+    """
+    phout_*.log of the newest run in the directory, the same file the sprint 3 tests check
+    """
+    logdirname = max(glob.glob(os.path.join(directory, '*/')), key=os.path.getctime)
+    for file_name in sorted(os.listdir(logdirname)):
+        name, end = os.path.splitext(file_name)
+        if name.startswith('phout_') and end == '.log':
+            return Path(logdirname) / file_name
+    raise FileNotFoundError(f'There is no phout_*.log in {logdirname}')
+
+
+def read_phout(path: Union[str, Path]) -> List[PhoutRecord]:
+    records = list()
+    with open(path) as phout:
+        for line in phout:
+            # Поля разделены табуляцией, тег без ammo-тегов пустой, поэтому числа берём с конца
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) < 12:
+                continue
+            values = [int(value) for value in fields[-10:]]
+            records.append(PhoutRecord(float(fields[0]), '\t'.join(fields[1:-10]), *values))
+    return records
+
+
+def expected_interval(instances: int, rps: float) -> float:
+    """
+    Microseconds between the requests of one sender: the load of rps requests per second is shared by the instances
+    """
+    return instances / rps * 1_000_000
+
+
+def read_tank_config(path: Union[str, Path]) -> Tuple[int, float]:
+    """
+    Instances and the mean rps of the schedule of the phantom section of a Yandex.Tank config, e.g. load.yaml
+    """
+    import yaml     # Есть там, где есть танк
+
+    phantom = yaml.safe_load(Path(path).read_text()).get('phantom', {})
+    schedule = phantom.get('load_profile', {}).get('schedule')
+    if not schedule:
+        raise ValueError(f'There is no phantom.load_profile.schedule in {path}')
+    times, duration = parse_schedule(schedule)
+    return int(phantom.get('instances', TANK_INSTANCES)), len(times) / duration
+
+
+def analyse(records: Sequence[PhoutRecord], expected_interval: Optional[float]) -> dict:
+    """
+    Histograms of interval_real as recorded and corrected for the coordinated omission: a server pause also delays
+    the requests the generator had to send during it, and the tank never records them. The expected interval has to
+    come from the load schedule, see expected_interval(). Without it nothing is corrected
+    """
+    raw = LatencyHistogram()
+    corrected = LatencyHistogram()
+    for record in records:
+        raw.record(record.interval_real)
+        corrected.record_corrected(record.interval_real, expected_interval)
+
+    return {'raw': raw, 'corrected': corrected, 'expected_interval': expected_interval}
+
+
+def summary(result: dict, percentiles: Sequence[float] = (50, 90, 95, 99, 99.9)) -> List[str]:
+    def ms(value):
+        return '-' if value is None else f'{value / 1000:.2f}'
+
+    raw, corrected = result['raw'], result['corrected']
+    lines = [f'expected interval {ms(result["expected_interval"])} ms, '
+             f'{raw.total} requests, {corrected.total - raw.total} added by the correction',
+             f'{"percentile":>10} {"raw ms":>10} {"corrected ms":>13}']
+    for percent in percentiles:
+        lines.append(f'{percent:>10} {ms(raw.percentile(percent)):>10} {ms(corrected.percentile(percent)):>13}')
+    lines.append(f'{"max":>10} {ms(raw.max):>10} {ms(corrected.max):>13}')
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Raw and coordinated omission corrected percentiles of a phout log')
+    parser.add_argument('path', type=Path, help='phout_*.log or a directory of tank runs, the newest one is taken')
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument('--expected-interval', type=float, help='Microseconds between the requests of one sender')
+    schedule.add_argument('--tank-config', type=Path, help='load.yaml to take the instances and the rps from')
+    args = parser.parse_args(argv)
+
+    interval = args.expected_interval
+    if args.tank_config is not None:
+        interval = expected_interval(*read_tank_config(args.tank_config))
+    path = find_phout(args.path) if args.path.is_dir() else args.path
+    print(path)
+    for line in summary(analyse(read_phout(path), interval)):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
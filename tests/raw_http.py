@@ -0,0 +1,210 @@
+import asyncio
+import socket
+
+from typing import Optional, Tuple, List, Union, Any
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+import json_codec
+
+
+# Ответы на эти запросы и с этими кодами никогда не содержат тела
+BODYLESS_METHODS = {'HEAD'}
+BODYLESS_STATUSES = {204, 304}
+# Эти запросы можно повторить, не зная, выполнил ли их сервер
+IDEMPOTENT_METHODS = {'GET', 'HEAD'}
+
+
+class RawRequest:
+    """
+    The request the raw response is an answer to. Mimics the fields of requests.PreparedRequest used by the tests
+    """
+
+    def __init__(self, method: str, url: str, headers: CaseInsensitiveDict, body: bytes):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return f'<RawRequest [{self.method}]>'
+
+
+class RawResponse:
+    """
+    HTTP response read straight from a socket. Mimics the part of requests.Response the tests rely on
+    """
+
+    def __init__(self, request: RawRequest, status_code: int, reason: str,
+                 headers: CaseInsensitiveDict, content: bytes, until_close: bool = False):
+        self.request = request
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.until_close = until_close     # The body was delimited by the server closing the connection
+        self.url = request.url
+        self.__json = None
+        self.__decoded = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        """
+        Decodes the body on the first call only
+        """
+        if not self.__decoded:
+            self.__json = json_codec.loads(self.content)
+            self.__decoded = True
+        return self.__json
+
+    def keep_alive(self) -> bool:
+        """
+        Whether the connection can be reused: the server hasn't asked to close it and the body has a known length
+        """
+        return not self.until_close and self.headers.get('connection', '').lower() != 'close'
+
+    def __repr__(self):
+        return f'<RawResponse [{self.status_code}]>'
+
+
+def split_url(url: str) -> Tuple[str, int]:
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or 80
+
+
+def encode_request(method: str, host: str, path: str, headers: Optional[dict] = None,
+                   body: Union[bytes, str, None] = None, json_data: Any = None) -> Tuple[bytes, RawRequest]:
+    if json_data is not None:
+        body = json_codec.dumps(json_data)
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'application/json')
+    if isinstance(body, str):
+        body = body.encode()
+    body = body or b''
+
+    if not path.startswith('/'):
+        path = '/' + path
+
+    all_headers = CaseInsensitiveDict({'Host': host})
+    all_headers.update(headers or {})
+    if body or method in {'POST', 'PUT', 'PATCH'}:
+        all_headers['Content-Length'] = str(len(body))
+
+    lines = [f'{method} {path} HTTP/1.1']
+    lines.extend(f'{key}: {value}' for key, value in all_headers.items())
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    return head + body, RawRequest(method, f'http://{host}{path}', all_headers, body)
+
+
+def parse_head(head: bytes) -> Tuple[int, str, CaseInsensitiveDict]:
+    lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    status_line = lines[0].split(' ', 2)
+    if len(status_line) < 2 or not status_line[0].startswith('HTTP/'):
+        raise ConnectionError(f'Malformed status line: {lines[0]!r}')
+
+    status_code = int(status_line[1])
+    reason = status_line[2] if len(status_line) > 2 else ''
+
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        key, _, value = line.partition(':')
+        key = key.strip()
+        value = value.strip()
+        if key in headers:
+            headers[key] = f'{headers[key]}, {value}'
+        else:
+            headers[key] = value
+
+    return status_code, reason, headers
+
+
+def body_length(request: RawRequest, status_code: int, headers: CaseInsensitiveDict) -> Optional[int]:
+    """
+    Returns the body length, -1 for a chunked body or None for a body delimited by the connection close
+    """
+    if request.method in BODYLESS_METHODS or status_code in BODYLESS_STATUSES or 100 <= status_code < 200:
+        return 0
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        return -1
+    if 'content-length' in headers:
+        return int(headers['content-length'])
+    return None
+
+
+def read_response(stream, request: RawRequest) -> RawResponse:
+    """
+    Reads one response from a buffered binary file object, e.g. socket.makefile('rb')
+    """
+    head: List[bytes] = []
+    while True:
+        line = stream.readline(65537)
+        if not line:
+            raise ConnectionError('Connection closed by the server')
+        head.append(line)
+        if line in (b'\r\n', b'\n'):
+            break
+
+    status_code, reason, headers = parse_head(b''.join(head))
+    length = body_length(request, status_code, headers)
+
+    if length is None:
+        content = stream.read()
+    elif length == -1:
+        chunks = []
+        while True:
+            size = int(stream.readline().split(b';')[0], 16)
+            if size == 0:
+                while stream.readline() not in (b'\r\n', b'\n', b''):
+                    pass    # Trailers
+                break
+            chunks.append(stream.read(size))
+            stream.readline()
+        content = b''.join(chunks)
+    else:
+        content = stream.read(length)
+        if len(content) != length:
+            raise ConnectionError('Connection closed by the server')
+
+    return RawResponse(request, status_code, reason, headers, content, until_close=length is None)
+
+
+async def read_response_async(reader: asyncio.StreamReader, request: RawRequest) -> RawResponse:
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+        status_code, reason, headers = parse_head(head)
+        length = body_length(request, status_code, headers)
+
+        if length is None:
+            content = await reader.read()
+        elif length == -1:
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while await reader.readline() not in (b'\r\n', b'\n', b''):
+                        pass    # Trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b''.join(chunks)
+        else:
+            content = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError('Connection closed by the server')
+
+    return RawResponse(request, status_code, reason, headers, content, until_close=length is None)
+
+
+def connect(host: str, port: int, timeout: Optional[float] = None) -> socket.socket:
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import re
+import secrets
+import signal
+import threading
+import time
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from game_server import GameServer, Point
+
+
+MODE_THREADED = 'threaded'
+MODE_ASYNCIO = 'asyncio'
+
+TOKEN_PATTERN = re.compile(r'^Bearer ([0-9a-fA-F]{32})$')
+DIRECTIONS = {'L', 'R', 'U', 'D', ''}
+GET_HEAD = ('GET', 'HEAD')
+POST = ('POST',)
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+def log_json(message: str, data: dict):
+    """
+    A log line in the format of the C++ servers, so the start pattern and the log tests see the same thing
+    """
+    line = json.dumps({'timestamp': datetime.now().isoformat(), 'data': data, 'message': message})
+    print(line, flush=True)
+
+
+class ApiError(Exception):
+
+    def __init__(self, status: int, code: str, message: str, allow: Optional[Tuple[str, ...]] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.allow = allow
+
+
+class ReferenceApi:
+    """
+    The game API of the C++ servers on top of game_server.GameServer: maps, join, players, state, player action and
+    tick with the same error codes. It's independent of the transport, the servers below only pass the requests in
+    """
+
+    def __init__(self, config: Union[str, Path], tick_period: Optional[int] = None):
+        self.game = GameServer(Path(config))
+        self.tick_period = tick_period
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def handle(self, method: str, target: str, headers, body: bytes) -> Response:
+        path = target.split('?', 1)[0]
+        try:
+            status, payload = self.dispatch(method, path, headers, body)
+            extra = dict()
+        except ApiError as ex:
+            status, payload = ex.status, {'code': ex.code, 'message': ex.message}
+            extra = {'Allow': ', '.join(ex.allow)} if ex.allow else dict()
+        except Exception as ex:    # Ошибка модели должна дойти до клиента ответом, а не оборванным соединением
+            log_json('error', {'code': 500, 'exception': repr(ex), 'method': method, 'URI': target})
+            status, payload = 500, {'code': 'internalError', 'message': str(ex) or type(ex).__name__}
+            extra = dict()
+
+        content = json.dumps(payload).encode()
+        response_headers = {'Content-Type': 'application/json', 'Cache-Control': 'no-cache',
+                            'Content-Length': str(len(content)), **extra}
+        return status, response_headers, b'' if method == 'HEAD' else content
+
+    def dispatch(self, method: str, path: str, headers, body: bytes) -> Tuple[int, object]:
+        if path.rstrip('/') == '/api/v1/maps':
+            self.check_method(method, GET_HEAD)
+            return 200, self.game.get_maps()
+        if path.startswith('/api/v1/maps/'):
+            self.check_method(method, GET_HEAD)
+            return 200, self.get_map(path[len('/api/v1/maps/'):])
+
+        if path == '/api/v1/game/join':
+            self.check_method(method, POST, 'Only POST method is expected')
+            return 200, self.join(self.parse_body(body, 'Join game request parse error'))
+        if path == '/api/v1/game/players':
+            self.check_method(method, GET_HEAD)
+            return 200, self.get_players(self.authorize(headers))
+        if path == '/api/v1/game/state':
+            self.check_method(method, GET_HEAD)
+            return 200, self.get_state(self.authorize(headers))
+        if path == '/api/v1/game/player/action':
+            self.check_method(method, POST)
+            token = self.authorize(headers)
+            return 200, self.action(token, self.parse_body(body, 'Failed to parse action'))
+        if path == '/api/v1/game/tick':
+            if self.tick_period is not None:
+                raise ApiError(400, 'badRequest', 'Invalid endpoint')
+            self.check_method(method, POST)
+            return 200, self.tick(self.parse_body(body, 'Failed to parse tick request JSON'))
+
+        raise ApiError(400, 'badRequest', 'Bad request')
+
+    @staticmethod
+    def check_method(method: str, allowed: Tuple[str, ...], message: str = 'Invalid method'):
+        if method not in allowed:
+            raise ApiError(405, 'invalidMethod', message, allowed)
+
+    @staticmethod
+    def parse_body(body: bytes, message: str) -> dict:
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            raise ApiError(400, 'invalidArgument', message)
+        if not isinstance(data, dict):
+            raise ApiError(400, 'invalidArgument', message)
+        return data
+
+    def authorize(self, headers) -> str:
+        match = TOKEN_PATTERN.match(headers.get('Authorization') or '')
+        if match is None:
+            raise ApiError(401, 'invalidToken', 'Authorization header is missing')
+        token = match.group(1)
+        with self.lock:
+            if self.game.find_player(token) is None:
+                raise ApiError(401, 'unknownToken', 'Player token has not been found')
+        return token
+
+    def get_map(self, map_id: str) -> dict:
+        game_map = self.game.get_map(map_id)
+        if game_map is None:
+            raise ApiError(404, 'mapNotFound', 'Map not found')
+        # dogSpeed в ответе C++ сервера не отдаётся
+        return {key: value for key, value in game_map.items() if key != 'dogSpeed'}
+
+    def join(self, data: dict) -> dict:
+        user_name, map_id = data.get('userName'), data.get('mapId')
+        if not isinstance(map_id, str):
+            raise ApiError(400, 'invalidArgument', 'Join game request parse error')
+        if not isinstance(user_name, str) or not user_name:
+            raise ApiError(400, 'invalidArgument', 'Invalid name')
+
+        game_map = self.game.get_map(map_id)
+        if game_map is None:
+            raise ApiError(404, 'mapNotFound', 'Map not found')
+        if not game_map.get('roads'):
+            # Собаку негде поставить, а без ответа клиент ждал бы до таймаута
+            raise ApiError(500, 'internalError', 'The map has no roads to place the dog on')
+        road = game_map['roads'][0]
+        position = Point(float(road['x0']), float(road['y0']))
+
+        token = secrets.token_hex(16)
+        with self.lock:
+            player_id = self.next_id
+            self.next_id += 1
+            self.game.join(user_name, map_id, token, player_id, position)
+        return {'authToken': token, 'playerId': player_id}
+
+    def get_players(self, token: str) -> dict:
+        with self.lock:
+            session, _ = self.game.find_player(token)
+            return {str(player.id): {'name': player.name} for player in session.players}
+
+    def get_state(self, token: str) -> dict:
+        with self.lock:
+            return self.game.get_state(token)
+
+    def action(self, token: str, data: dict) -> dict:
+        direction = data.get('move')
+        if direction not in DIRECTIONS:
+            raise ApiError(400, 'invalidArgument', 'Failed to parse action')
+        with self.lock:
+            self.game.move(token, direction)
+        return dict()
+
+    def tick(self, data: dict) -> dict:
+        delta = data.get('timeDelta')
+        # bool в Python тоже int, а сервер его не принимает
+        if type(delta) is not int or delta < 0:
+            raise ApiError(400, 'invalidArgument', 'Failed to parse tick request JSON')
+        self.tick_all(delta)
+        return dict()
+
+    def tick_all(self, delta: int):
+        with self.lock:
+            self.game.tick(delta)
+
+    def run_ticker(self, stop: threading.Event):
+        """
+        Advances the game every tick_period milliseconds, as the server does when it's started with --tick-period
+        """
+        last = time.monotonic()
+        while not stop.wait(self.tick_period / 1000):
+            now = time.monotonic()
+            self.tick_all(round((now - last) * 1000))
+            last = now
+
+
+class ThreadedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными send, с алгоритмом Нейгла ответ ждал бы отложенного ACK клиента
+    disable_nagle_algorithm = True
+    api: ReferenceApi = None
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            self.close_connection = True
+
+    def __getattr__(self, name: str):
+        # do_GET, do_POST, do_OPTIONS... все методы обрабатывает API
+        if name.startswith('do_'):
+            return self.respond
+        raise AttributeError(name)
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, content = self.api.handle(self.command, self.path, self.headers, body)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+def make_threaded_server(api: ReferenceApi, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type('Handler', (ThreadedHandler,), {'api': api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class AsyncioServer:
+    """
+    The same API served by one asyncio event loop: keep-alive connections, Content-Length bodies only
+    """
+
+    REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+    def __init__(self, api: ReferenceApi, host: str, port: int):
+        self.api = api
+        self.host = host
+        self.port = port
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+                method, target, version = (lines[0].split(' ', 2) + ['', ''])[:3]
+                headers = dict()
+                for line in lines[1:]:
+                    key, _, value = line.partition(':')
+                    headers[key.strip().title()] = value.strip()
+                length = int(headers.get('Content-Length') or 0)
+                body = await reader.readexactly(length) if length else b''
+
+                status, response_headers, content = self.api.handle(method, target, headers, body)
+                response = [f'HTTP/1.1 {status} {self.REASONS.get(status, "")}']
+                response.extend(f'{key}: {value}' for key, value in response_headers.items())
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1') + content)
+                await writer.drain()
+
+                if headers.get('Connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass    # The client is gone or the server is stopping
+        finally:
+            writer.close()
+
+    async def serve(self, started: Optional[threading.Event] = None):
+        server = await asyncio.start_server(self.serve_client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+
+class ReferenceServer:
+    """
+    Runs the reference API in the background of the current process, e.g.
+
+        with ReferenceServer(os.environ['CONFIG_PATH']) as server:
+            api = CppServer(server.host, server.port)
+            api.join('Dog', 'map1') ...
+    """
+
+    def __init__(self, config: Union[str, Path], host: str = '127.0.0.1', port: int = 0, mode: str = MODE_THREADED,
+                 tick_period: Optional[int] = None):
+        self.api = ReferenceApi(config, tick_period)
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.__server = None
+        self.__loop = None
+        self.__stop = threading.Event()
+        self.__threads = list()
+        self.__error = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/'
+
+    def start(self):
+        if self.mode == MODE_THREADED:
+            self.__server = make_threaded_server(self.api, self.host, self.port)
+            self.port = self.__server.server_address[1]
+            self.__spawn(self.__server.serve_forever, 'reference server')
+        elif self.mode == MODE_ASYNCIO:
+            started = threading.Event()
+            self.__server = AsyncioServer(self.api, self.host, self.port)
+            self.__spawn(self.__run_loop, 'reference server', started)
+            started.wait()
+            if self.__error is not None:
+                raise self.__error
+            self.port = self.__server.port
+        else:
+            raise ValueError(f'Unknown mode {self.mode!r}, expected {MODE_THREADED} or {MODE_ASYNCIO}')
+
+        if self.api.tick_period is not None:
+            self.__spawn(self.api.run_ticker, 'reference ticker', self.__stop)
+        return self
+
+    def __spawn(self, target, name: str, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self.__threads.append(thread)
+
+    def __run_loop(self, started: threading.Event):
+        self.__loop = asyncio.new_event_loop()
+        task = self.__loop.create_task(self.__server.serve(started))
+        try:
+            self.__loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        except OSError as ex:
+            self.__error = ex   # E.g. the port is taken, start() raises it
+        finally:
+            self.__loop.close()
+            started.set()
+
+    def stop(self):
+        self.__stop.set()
+        if isinstance(self.__server, ThreadingHTTPServer):
+            self.__server.shutdown()
+            self.__server.server_close()
+        elif self.__loop is not None and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(self.__loop)])
+        for thread in self.__threads:
+            thread.join(timeout=1.0)
+        self.__threads.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Python reference implementation of the game server API')
+    parser.add_argument('-c', '--config-file', type=Path, required=True,
+                        help='Game config, e.g. data/config.json of a solution, the CONFIG_PATH of scripts/*/run.sh')
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    parser.add_argument('--address', default='0.0.0.0')
+    parser.add_argument('-t', '--tick-period', type=int, help='Advance the game every N milliseconds')
+    parser.add_argument('--mode', choices=[MODE_THREADED, MODE_ASYNCIO], default=MODE_THREADED)
+    args = parser.parse_args(argv)
+
+    server = ReferenceServer(args.config_file, args.address, args.port, args.mode, args.tick_period).start()
+    log_json('server started', {'port': server.port, 'address': args.address, 'mode': args.mode})
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    while not stopped.wait(1.0):
+        pass
+    server.stop()
+    log_json('server exited', {'code': 0})
+
+
+if __name__ == '__main__':
+    main()
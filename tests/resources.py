@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Union
+
+import docker
+import docker.errors
+
+from cpp_server_api import CppServer, ServerException
+
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Sample(NamedTuple):
+    """
+    Resources of the server at a moment, None if the source doesn't report it. Network bytes are of the container,
+    or of the whole network namespace for a local process
+    """
+    time: float
+    cpu_seconds: Optional[float]
+    rss_bytes: Optional[int]
+    threads: Optional[int]
+    fds: Optional[int]
+    rx_bytes: Optional[int]
+    tx_bytes: Optional[int]
+
+
+def count_fds(pid: int) -> Optional[int]:
+    try:
+        return len(os.listdir(f'/proc/{pid}/fd'))
+    except OSError:
+        return None     # Another user's process or not on this host
+
+
+def read_net_dev(pid: int):
+    rx = tx = 0
+    with open(f'/proc/{pid}/net/dev') as net_dev:
+        for line in list(net_dev)[2:]:
+            fields = line.split(':', 1)[1].split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+    return rx, tx
+
+
+def process_sample(pid: int) -> Sample:
+    """
+    Reads /proc/<pid> of a local process
+    """
+    with open(f'/proc/{pid}/stat') as stat:
+        # Имя процесса может содержать пробелы и скобки, поля считаем после последней скобки
+        fields = stat.read().rsplit(')', 1)[1].split()
+    utime, stime, threads, rss_pages = int(fields[11]), int(fields[12]), int(fields[17]), int(fields[21])
+    rx, tx = read_net_dev(pid)
+    return Sample(time.time(), (utime + stime) / CLOCK_TICKS, rss_pages * PAGE_SIZE, threads, count_fds(pid), rx, tx)
+
+
+def container_stats(container) -> dict:
+    try:
+        return container.stats(stream=False, one_shot=True)
+    except docker.errors.InvalidVersion:
+        return container.stats(stream=False)    # Waits for the second CPU sample, about a second
+
+
+def container_sample(container) -> Sample:
+    """
+    Reads the Docker stats API. RSS is the anonymous memory of the cgroup, the page cache isn't counted
+    """
+    stats = container_stats(container)
+    if not stats.get('read') or stats['read'].startswith('0001'):
+        raise ServerException('The container isn\'t running', {'container': container.name})
+
+    memory = stats.get('memory_stats', {})
+    memory_details = memory.get('stats', {})
+    rss = memory_details.get('rss', memory_details.get('anon'))
+    if rss is None and 'usage' in memory:
+        rss = memory['usage'] - memory_details.get('total_inactive_file', memory_details.get('inactive_file', 0))
+
+    networks = stats.get('networks')
+    rx = sum(network['rx_bytes'] for network in networks.values()) if networks else None
+    tx = sum(network['tx_bytes'] for network in networks.values()) if networks else None
+
+    cpu = stats.get('cpu_stats', {}).get('cpu_usage', {}).get('total_usage')
+    pid = container.attrs.get('State', {}).get('Pid')
+    return Sample(time.time(), None if cpu is None else cpu / 1e9, rss, stats.get('pids_stats', {}).get('current'),
+                  count_fds(pid) if pid else None, rx, tx)
+
+
+class ResourceSampler:
+    """
+    Samples the resources of a server every interval seconds in a background thread. The first and the last samples
+    are taken synchronously by start() and stop(), so the growth is known even for a short test
+    """
+
+    def __init__(self, source: Callable[[], Sample], interval: float = 0.5):
+        self.source = source
+        self.interval = interval
+        self.samples: List[Sample] = list()
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def for_server(server: CppServer, interval: float = 0.5):
+        if server.container is not None:
+            return ResourceSampler(lambda: container_sample(server.container), interval)
+        if server.process is not None:
+            return ResourceSampler(lambda: process_sample(server.process.pid), interval)
+        raise ServerException('There is neither a container nor a process to sample', {'url': server.url})
+
+    def sample(self):
+        try:
+            self.samples.append(self.source())
+        except (OSError, ValueError, ServerException, docker.errors.APIError):
+            pass    # The server has stopped, the samples taken are kept
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self.__thread = threading.Thread(target=self.__run, name='resource sampler', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        self.sample()
+
+    def values(self, field: str) -> List[Union[int, float]]:
+        return [getattr(sample, field) for sample in self.samples if getattr(sample, field) is not None]
+
+    def growth(self, field: str = 'rss_bytes') -> Optional[Union[int, float]]:
+        """
+        The last value minus the first one
+        """
+        values = self.values(field)
+        return values[-1] - values[0] if len(values) > 1 else None
+
+    def peak(self, field: str = 'rss_bytes') -> Optional[Union[int, float]]:
+        values = self.values(field)
+        return max(values) if values else None
+
+    def to_dict(self) -> dict:
+        # Столбцы отдельно от строк, чтобы длинный ряд оставался компактным
+        return {'interval': self.interval, 'columns': list(Sample._fields), 'rows': [list(s) for s in self.samples]}
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), separators=(',', ':')))
+
+    def summary(self) -> str:
+        def mb(value):
+            return '-' if value is None else f'{value / 1024 / 1024:.1f} MB'
+
+        rss = self.values('rss_bytes')
+        cpu = self.growth('cpu_seconds')
+        return (f'{len(self.samples)} samples, rss {mb(rss[0] if rss else None)} -> peak {mb(self.peak())}, '
+                f'growth {mb(self.growth())}, cpu {"-" if cpu is None else f"{cpu:.2f} s"}, '
+                f'threads peak {self.peak("threads")}, fds peak {self.peak("fds")}')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Samples the resources of a server container or process, '
+                                                 'e.g. during a load_generator run')
+    parser.add_argument('target', help='Container name or id, or the pid of a local process')
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between the samples')
+    parser.add_argument('--duration', type=float, help='Seconds to sample, until Ctrl+C by default')
+    parser.add_argument('--output', type=Path, default=Path('resources.json'))
+    args = parser.parse_args(argv)
+
+    if args.target.isdigit():
+        sampler = ResourceSampler(lambda: process_sample(int(args.target)), args.interval)
+    else:
+        container = docker.from_env().containers.get(args.target)
+        sampler = ResourceSampler(lambda: container_sample(container), args.interval)
+
+    with sampler:
+        try:
+            threading.Event().wait(args.duration)
+        except KeyboardInterrupt:
+            pass
+    sampler.save(args.output)
+    print(sampler.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import os
+import threading
+
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import docker.errors
+
+from cpp_server_api import CppServer, READINESS_LOG, PROBE_ENDPOINT, probe_http
+
+
+PoolKey = Tuple
+
+
+class ServerPool:
+    """
+    Containers started in advance, one queue per image with its entrypoint, args and readiness mode. Tests check
+    servers out and hand them back, a server is stopped after max_uses tests or when it becomes unhealthy, and a
+    replacement is started in the background as soon as one is taken
+    """
+
+    def __init__(self, factory: Callable[..., CppServer], size: int = 2, max_uses: int = 1):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.pid = os.getpid()
+        self.__idle: Dict[PoolKey, List[Future]] = defaultdict(list)
+        self.__keys: Dict[int, PoolKey] = dict()
+        self.__uses: Dict[int, int] = dict()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max(2, 2 * size), thread_name_prefix='server pool')
+
+    @staticmethod
+    def key(image: str, **kwargs) -> PoolKey:
+        return (image, *sorted((name, tuple(value) if isinstance(value, list) else value)
+                               for name, value in kwargs.items()))
+
+    def prefill(self, image: str, **kwargs):
+        """
+        Starts the servers missing up to the pool size in the background
+        """
+        key = self.key(image, **kwargs)
+        with self.__lock:
+            idle = self.__idle[key]
+            while len(idle) < self.size:
+                idle.append(self.__executor.submit(self.factory, image, **kwargs))
+
+    @staticmethod
+    def is_healthy(server: CppServer, **kwargs) -> bool:
+        if server.container is None:
+            return False
+        try:
+            server.container.reload()
+            if server.container.status != 'running':
+                return False
+        except docker.errors.APIError:
+            return False
+        # Проба попала бы в логи, которые проверяет тест
+        if kwargs.get('readiness') == READINESS_LOG:
+            return True
+        return probe_http(server.url, kwargs.get('probe_endpoint', PROBE_ENDPOINT))
+
+    def checkout(self, image: str, **kwargs) -> CppServer:
+        key = self.key(image, **kwargs)
+        with self.__lock:
+            idle = self.__idle[key]
+            futures, idle[:] = list(idle), list()
+        # Сначала отдаём уже запущенные серверы
+        futures.sort(key=lambda future: not future.done())
+
+        server = None
+        while futures and server is None:
+            try:
+                candidate = futures.pop(0).result()
+            except Exception:
+                continue    # The server didn't start, the next one or a new one is taken
+            if self.is_healthy(candidate, **kwargs):
+                server = candidate
+            else:
+                with self.__lock:
+                    self.__uses.pop(id(candidate), None)
+                self.__stop(candidate)
+        with self.__lock:
+            self.__idle[key][:0] = futures
+        self.prefill(image, **kwargs)
+
+        if server is None:
+            server = self.factory(image, **kwargs)
+        with self.__lock:
+            self.__keys[id(server)] = key
+            self.__uses.setdefault(id(server), 0)
+        return server
+
+    def checkin(self, server: CppServer, **kwargs):
+        with self.__lock:
+            key = self.__keys.pop(id(server), None)
+            uses = self.__uses.pop(id(server), 0) + 1
+        if key is None or uses >= self.max_uses or not self.is_healthy(server, **kwargs):
+            self.__executor.submit(self.__stop, server)
+            return
+
+        # Следующий тест не должен видеть записи лога и трафика этого
+        if server.logs is not None:
+            server.cursor = len(server.logs.lines)
+        server.recorder = None
+        future = Future()
+        future.set_result(server)
+        with self.__lock:
+            self.__uses[id(server)] = uses
+            self.__idle[key].append(future)
+
+    @staticmethod
+    def __stop(server: CppServer):
+        try:
+            server.__del__()
+        except docker.errors.APIError:
+            pass
+        server.container = None
+
+    def close(self):
+        with self.__lock:
+            futures = [future for idle in self.__idle.values() for future in idle]
+            self.__idle.clear()
+        for future in futures:
+            if future.cancel():
+                continue
+            try:
+                self.__stop(future.result())
+            except Exception:
+                pass
+        self.__executor.shutdown(wait=True)
@@ -0,0 +1,194 @@
+import argparse
+import json
+import re
+import shlex
+import statistics
+import subprocess
+import time
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import docker
+import docker.errors
+
+import isolation
+import raw_http
+from cpp_server_api import PROBE_ENDPOINT
+
+
+START_PATTERN = '[Ss]erver (has )?started'
+BUILD_PATTERN = re.compile(r'docker\s+build\s+(?:.*\s)?-t\s+(\S+)')
+EXPORT_PATTERN = re.compile(r'^\s*export\s+(\w+)=(.*)$', re.MULTILINE)
+METRICS = ('first_log', 'start_pattern', 'first_response')
+EXIT_CHECK_PERIOD = 0.1
+
+
+class ImageSpec(NamedTuple):
+    """
+    An image of scripts/sprint*/*/build.sh with the entrypoint and the arguments its run.sh passes to the tests
+    """
+    image: str
+    build_script: Path
+    entrypoint: Optional[str]
+    container_args: Optional[List[str]]
+
+
+def discover(scripts: Path) -> List[ImageSpec]:
+    specs = list()
+    for build_script in sorted(scripts.glob('sprint*/*/build.sh')):
+        match = BUILD_PATTERN.search(build_script.read_text())
+        if match is None:
+            continue    # The solution is built locally, without an image
+        run_script = build_script.with_name('run.sh')
+        exports = dict()
+        if run_script.exists():
+            exports = {name: ' '.join(shlex.split(value)) for name, value in
+                       EXPORT_PATTERN.findall(run_script.read_text())}
+        container_args = exports.get('CONTAINER_ARGS')
+        specs.append(ImageSpec(match.group(1), build_script, exports.get('ENTRYPOINT'),
+                               container_args.split() if container_args else None))
+    return specs
+
+
+def parse_docker_time(text: str) -> float:
+    """
+    RFC 3339 time of the docker daemon with nanoseconds, e.g. 2023-01-01T10:00:00.123456789Z
+    """
+    text = text.rstrip('Z')
+    seconds, _, fraction = text.partition('.')
+    moment = datetime.fromisoformat(seconds).replace(tzinfo=timezone.utc)
+    return moment.timestamp() + float(f'0.{fraction or 0}')
+
+
+def is_answered(host: str, port: int, endpoint: str, timeout: float) -> bool:
+    try:
+        with raw_http.connect(host, port, timeout) as sock, sock.makefile('rb') as stream:
+            data, request = raw_http.encode_request('GET', f'{host}:{port}', endpoint, {'Connection': 'close'})
+            sock.sendall(data)
+            return raw_http.read_response(stream, request).status_code == 200
+    except (OSError, ValueError):
+        return False
+
+
+def measure_once(client: docker.DockerClient, spec: ImageSpec, start_pattern: str = START_PATTERN,
+                 endpoint: str = PROBE_ENDPOINT, timeout: float = 10.0) -> Dict[str, Optional[float]]:
+    """
+    Seconds from the moment before the creation request to the first log line of the container, to the start pattern
+    and to the first 200 answer to the endpoint, so the three are comparable. The log lines are timed by docker's
+    timestamps against the wall clock at that moment (the daemon has to run on this host), the answer by the
+    monotonic clock
+    """
+    kwargs = {'detach': True, 'name': isolation.unique_name(spec.image.split('/')[-1].split(':')[0])}
+    if spec.entrypoint:
+        kwargs['entrypoint'] = spec.entrypoint
+    network = isolation.worker_network(client)
+    if network:
+        kwargs['network'] = network
+
+    origin = time.time()
+    start = time.monotonic()
+    container = isolation.run_container(client, spec.image, spec.container_args, **kwargs)
+    try:
+        container.reload()
+        host = container.name if network else container.attrs['NetworkSettings']['IPAddress']
+        result = dict.fromkeys(METRICS)
+        deadline = start + timeout
+        next_check = start + EXIT_CHECK_PERIOD
+        while time.monotonic() < deadline:
+            if is_answered(host, 8080, endpoint, min(1.0, timeout)):
+                result['first_response'] = time.monotonic() - start
+                break
+            # Образы тестов и танка не отвечают по HTTP, ждать их до timeout незачем
+            if time.monotonic() >= next_check:
+                container.reload()
+                if container.status == 'exited':
+                    break
+                next_check = time.monotonic() + EXIT_CHECK_PERIOD
+            time.sleep(0.001)
+
+        regex = re.compile(start_pattern)
+        for line in container.logs(timestamps=True).decode(errors='replace').splitlines():
+            stamp, _, text = line.partition(' ')
+            if result['first_log'] is None:
+                result['first_log'] = parse_docker_time(stamp) - origin
+            if regex.search(text) is not None:
+                result['start_pattern'] = parse_docker_time(stamp) - origin
+                break
+        return result
+    finally:
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+
+
+def distribution(values: Sequence[float]) -> dict:
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(percent: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    return {'count': len(ordered), 'min': ordered[0], 'p50': percentile(50), 'p90': percentile(90),
+            'p99': percentile(99), 'max': ordered[-1], 'mean': statistics.fmean(ordered), 'samples': list(values)}
+
+
+def benchmark(client: docker.DockerClient, spec: ImageSpec, repeat: int, **kwargs) -> dict:
+    runs = {metric: list() for metric in METRICS}
+    errors = list()
+    for _ in range(repeat):
+        try:
+            result = measure_once(client, spec, **kwargs)
+        except docker.errors.DockerException as ex:
+            errors.append(str(ex))
+            continue
+        for metric, value in result.items():
+            if value is not None:
+                runs[metric].append(value)
+    # Пропуски считаем отдельно: сервер, не ответивший за timeout, не должен выглядеть быстрым
+    started = repeat - len(errors)
+    return {'repeat': repeat, 'errors': errors,
+            **{metric: {**distribution(runs[metric]), 'missed': started - len(runs[metric])} for metric in METRICS}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Container start to first response times of the sprint images')
+    parser.add_argument('--scripts', type=Path, default=Path(__file__).resolve().parent.parent / 'scripts',
+                        help='Directory with sprint*/*/build.sh')
+    parser.add_argument('--images', nargs='*', help='Only these images, all the found ones by default')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=10.0, help='Seconds to wait for the first response')
+    parser.add_argument('--start-pattern', default=START_PATTERN)
+    parser.add_argument('--endpoint', default=PROBE_ENDPOINT)
+    parser.add_argument('--build', action='store_true', help='Run build.sh of every image first')
+    parser.add_argument('--output', type=Path, default=Path('startup.json'))
+    args = parser.parse_args(argv)
+
+    specs = [spec for spec in discover(args.scripts) if not args.images or spec.image in args.images]
+    client = docker.from_env()
+    results = dict()
+    for spec in specs:
+        if args.build and subprocess.run(['bash', str(spec.build_script)]).returncode != 0:
+            results[spec.image] = {'repeat': 0, 'errors': [f'{spec.build_script} failed']}
+            continue
+        try:
+            client.images.get(spec.image)
+        except docker.errors.ImageNotFound:
+            results[spec.image] = {'repeat': 0, 'errors': ['The image is not built']}
+            continue
+
+        results[spec.image] = benchmark(client, spec, args.repeat, start_pattern=args.start_pattern,
+                                        endpoint=args.endpoint, timeout=args.timeout)
+        line = ', '.join(f'{metric} p50 {results[spec.image][metric].get("p50", float("nan")) * 1000:.1f} ms'
+                         for metric in METRICS)
+        print(f'{spec.image}: {line}')
+
+    args.output.write_text(json.dumps(results, indent=2))
+    isolation.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+import pytest
+
+
+TESTS_DIR = Path(__file__).resolve().parent
+
+# Каждый тест записывает запрос в гистограммы своего процесса и оставляет свой pid
+RECORDING_TESTS = '''
+import os
+import time
+
+import latency
+
+
+def record(name):
+    latency.RECORDER.record_request('GET', '/api/v1/' + name, 200, 0.001)
+    time.sleep(0.2)     # The workers have to take the tests in parallel
+    with open(os.path.join(os.environ['PID_DIR'], str(os.getpid())), 'a') as f:
+        f.write(name + '\\n')
+
+
+def test_maps():
+    record('maps')
+
+
+def test_state():
+    record('game/state')
+
+
+def test_join():
+    record('game/join')
+
+
+def test_tick():
+    record('game/tick')
+'''
+
+
+def test_parallel_workers_latency_is_reported(tmp_path: Path):
+    pytest.importorskip('pytest_parallel')
+    (tmp_path / 'test_recording.py').write_text(RECORDING_TESTS)
+    pid_dir = tmp_path / 'pids'
+    pid_dir.mkdir()
+    report = tmp_path / 'latency.json'
+
+    env = {**os.environ, 'PID_DIR': str(pid_dir), 'PYTHONPATH': os.pathsep.join(
+        [str(TESTS_DIR), os.environ.get('PYTHONPATH', '')])}
+    for name in ('IMAGE_NAME', 'SERVER_BINARY', 'LATENCY_PARTS_DIR', 'LATENCY_PARENT_PID'):
+        env.pop(name, None)
+    result = subprocess.run([sys.executable, '-m', 'pytest', '-p', 'conftest', '-p', 'no:cacheprovider',
+                             '--workers', '2', '--rootdir', str(tmp_path), '--latency-report', str(report),
+                             str(tmp_path / 'test_recording.py')],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    pids = {path.name for path in pid_dir.iterdir()}
+    assert len(pids) == 2     # The tests did run in both child processes
+    counts = {item['endpoint']: item['count'] for item in json.loads(report.read_text())['endpoints']}
+    assert counts == {'GET /api/v1/maps': 1, 'GET /api/v1/game/state': 1,
+                      'GET /api/v1/game/join': 1, 'GET /api/v1/game/tick': 1}
+    assert 'client latency' in result.stdout
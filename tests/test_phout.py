@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import phout
+
+
+# Вторая строка из ammo без тегов: поле тега пустое
+PHOUT_SAMPLE = ('1700000000.000\tmaps\t12000\t100\t50\t11000\t850\t11500\t120\t400\t0\t200\n'
+                '1700000000.010\t\t250000\t100\t50\t249000\t850\t249500\t120\t400\t0\t200\n')
+
+
+def test_untagged_lines_are_read(tmp_path: Path):
+    path = tmp_path / 'phout_sample.log'
+    path.write_text(PHOUT_SAMPLE)
+
+    records = phout.read_phout(path)
+    assert [(record.tag, record.interval_real, record.proto_code) for record in records] == [
+        ('maps', 12000, 200), ('', 250000, 200)]
+
+
+def test_untagged_lines_are_corrected(tmp_path: Path):
+    path = tmp_path / 'phout_sample.log'
+    path.write_text(PHOUT_SAMPLE)
+
+    result = phout.analyse(phout.read_phout(path), 100000)
+    assert result['raw'].total == 2
+    # 250 ms при интервале в 100 ms: добавлен пропущенный запрос со 150 ms
+    assert result['corrected'].total == 3
+    assert result['corrected'].percentile(50) is not None
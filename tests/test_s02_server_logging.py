@@ -1,5 +1,10 @@
 import re
 
+import pytest
+
+
+# Проба готовности по HTTP попала бы в логи, поэтому ждём фразу о запуске сервера
+pytestmark = pytest.mark.readiness('log')
 
 ans_list = [
     {
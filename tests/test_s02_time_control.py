@@ -11,6 +11,10 @@ from game_server import Point, Vector2D, Direction
 @pytest.fixture()
 def game_server():
     config_path = pathlib.Path(os.environ['CONFIG_PATH'])
+    # GAME_ENGINE=numpy - модель на массивах NumPy, для проверок с тысячами собак
+    if os.environ.get('GAME_ENGINE') == 'numpy':
+        import vector_game
+        return vector_game.VectorGameServer(config_path)
     return game.GameServer(config_path)
 
 
@@ -39,10 +43,16 @@ def tick_both(server, game_server: game.GameServer, ticks):
 
 
 def add_player(server, game_server, map_id, name):
-    token, player_id = server.add_player(name, map_id)
-    position, _, _ = get_parsed_state(server, token, player_id)
-    game_server.join(name, map_id, token, player_id, Point(position[0], position[1]))
-    return token, player_id
+    return add_players(server, game_server, map_id, [name])[0]
+
+
+def add_players(server, game_server, map_id, names):
+    players = server.join_many(names, map_id)
+    states = server.states_many([token for token, _ in players], [player_id for _, player_id in players])
+    for name, (token, player_id), state in zip(names, players, states):
+        position = state.get('pos')
+        game_server.join(name, map_id, token, player_id, Point(position[0], position[1]))
+    return players
 
 
 def compare_states(cpp_state: dict, py_state: dict):
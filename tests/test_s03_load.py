@@ -7,6 +7,8 @@ import pytest
 
 import numpy as np
 
+import phout as phout_log
+
 
 @pytest.fixture
 def directory():
@@ -45,5 +47,18 @@ def test_percentiles(directory):
         arr = np.array(timings)
         p50 = np.percentile(arr, 50)
         p90 = np.percentile(arr, 90)
-        assert p50 <= 35000 # 35 ms == 35000 microseconds
-        assert p90 <= 50000 # 50 ms == 50000 microseconds
+
+    # Пропущенные танком из-за пауз сервера запросы, см. phout.analyse. Ожидаемый интервал берётся из расписания
+    # нагрузки в конфиге танка, конфиг читается только с LATENCY_CORRECTED
+    interval = None
+    if os.environ.get('LATENCY_CORRECTED'):
+        tank_config = Path(os.environ.get('TANK_CONFIG', 'load.yaml'))
+        interval = phout_log.expected_interval(*phout_log.read_tank_config(tank_config))
+    result = phout_log.analyse(phout_log.read_phout(os.path.join(logdirname, filename)), interval)
+    print('\n'.join(phout_log.summary(result)))
+    if os.environ.get('LATENCY_CORRECTED'):
+        p50 = result['corrected'].percentile(50)
+        p90 = result['corrected'].percentile(90)
+
+    assert p50 <= 35000 # 35 ms == 35000 microseconds
+    assert p90 <= 50000 # 50 ms == 50000 microseconds
@@ -81,12 +81,11 @@ def is_point_on_roads(roads: dict, point: list):
 
 
 def add_user_and_wait_loot(docker_server, name, map_id):
-    res = utils.join_to_map(docker_server, name, map_id)
-    token = res.json()['authToken']
-    utils.tick(docker_server, 5000*1000)
-    utils.tick(docker_server, 5000*1000)
-    utils.tick(docker_server, 5000*1000)
-    utils.tick(docker_server, 5000*1000)
+    with docker_server.batch() as batch:
+        join = batch.join(name, map_id)
+        for _ in range(4):
+            batch.tick(5000*1000)
+    token, _ = batch.results[join]
     return token
 
 
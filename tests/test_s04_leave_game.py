@@ -1,10 +1,7 @@
-import time
-
 import math
 import random
 import pytest
 import os
-import re
 import json
 
 import requests
@@ -12,19 +9,21 @@ import docker
 import docker.errors
 
 from game_server import Direction
-from dataclasses import dataclass
 from typing import List
 from cpp_server_api import CppServer as Server
-from cpp_server_api import ServerException
+from cpp_server_api import wait_for_server
 
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import psycopg2.errors
 
-from conftest import get_config, get_start_pattern
+from conftest import get_config, get_start_pattern, get_readiness, get_probe_endpoint, record_traffic
+import isolation
+import virtual_dogs
 
 
 DEFAULT_RETIREMENT_TIME = 60.0  # Из задания
+RSS_GROWTH_LIMIT = 50 * 1024 * 1024    # Рекорды сотни собак занимают килобайты, десятки мегабайт - это утечка
 
 
 def get_connection(db_name):
@@ -46,7 +45,7 @@ def flush_db(db_name):
 
 
 @pytest.fixture(scope='function')
-def postgres_server():
+def postgres_server(request):
 
     image_name = os.environ.get('IMAGE_NAME')
     user = os.environ.get('POSTGRES_USER', 'postgres')
@@ -57,9 +56,8 @@ def postgres_server():
 
     client = docker.from_env()
     inspector = docker.APIClient()
-    container = client.containers.create(image_name)
-    name = inspector.inspect_container(container.id)['Name'][1:]
-    inspector.remove_container(container.id)
+    # Имя контейнера - это и имя базы данных, оно уникально для каждого воркера
+    name = isolation.unique_name(image_name)
     flush_db(name)
 
     kwargs = {
@@ -73,22 +71,15 @@ def postgres_server():
     if docker_network:
         kwargs['network'] = docker_network
 
-    container = client.containers.run(image_name, **kwargs)
-    pattern = get_start_pattern()
-    logs = container.logs().decode()
-    start_time = time.time()
-    while re.search(pattern, logs) is None:
-        time.sleep(1)
-        logs = container.logs().decode()
-        current_time = time.time()
-        if current_time - start_time >= 3:
-            raise ServerException('Cannot get the right start phrase from the container.', {'logs': logs})
+    container = isolation.run_container(client, image_name, **kwargs)
     if docker_network:
         server_domain = name
     else:
         server_domain = inspector.inspect_container(container.id)['NetworkSettings']['IPAddress']
     server = Server(server_domain, '8080')
+    wait_for_server(server.url, container, get_start_pattern(), get_readiness(), get_probe_endpoint())
     server.container = container
+    record_traffic(server, request)
     yield server
     try:
         inspector.stop(container.id)
@@ -106,73 +97,10 @@ def compare(records: List[dict], tribe_records: List[dict]):
                 math.isclose(record['score'], t_record['score'])
 
 
-@dataclass
-class Player:
-
-    name: str
-    token: str
-    player_id: int
-    score: float = 0
-    playing_time: float = 0.0
-
-    def add_time(self, time_to_add: float):
-        self.playing_time += time_to_add
-
-    def get_dict(self) -> dict:
-        return {
-            "name": self.name,
-            "score": self.score,
-            "playTime": self.playing_time
-        }
-
-    def update_score(self, server):
-        state = server.get_player_state(self.token, self.player_id)
-        self.score = state['score']
-
-
-class Tribe:
-
-    def __init__(self, server, map_id: str, num_of_players: int = 10, prefix: str = 'Player'):
-        self.server: None = server
-        self.players: List[Player] = list()
-        for i in range(0, num_of_players):
-            name = f'{prefix} {i}'
-            token, player_id = server.join(name, map_id)
-            self.players.append(Player(name, token, player_id))
-
-    def __getitem__(self, index: int) -> Player:
-        return self.players[index]
-
-    def add_time(self, time_to_add: float):
-        for pl in self.players:
-            pl.add_time(time_to_add)
-
-    def get_list(self) -> list:
-        self.players.sort(key=lambda x: x.score, reverse=True)
-        res = [pl.get_dict() for pl in self.players]
-
-        return res
-
-    def update_scores(self):
-        for player in self.players:
-            player.update_score(self.server)
-
-    def randomized_turn(self):
-        for pl in self.players:
-            direction = Direction.random_str()
-            self.server.move(pl.token, direction)
+class Tribe(virtual_dogs.Tribe):
 
     def randomized_move(self):
-        r_time = get_retirement_time()
-        self.randomized_turn()
-        ticks = random.randint(100, min(10000, int(r_time*900)))
-        seconds = ticks / 1000
-        self.add_time(seconds)
-        tick_seconds(self.server, seconds)
-
-    def stop(self):
-        for pl in self.players:
-            self.server.move(pl.token, '')
+        super().randomized_move(get_retirement_time())
 
 
 def get_retirement_time() -> float:
@@ -337,7 +265,8 @@ def test_a_hundred_records(postgres_server, map_id):
     compare(records, tribe_records)
 
 
-def test_a_hundred_plus_records(postgres_server, map_id):
+def test_a_hundred_plus_records(postgres_server, map_id, resource_sampler):
+    sampler = resource_sampler(postgres_server)
     tribe = Tribe(postgres_server, map_id, num_of_players=150)
     r_time = get_retirement_time()
     for _ in range(0, random.randint(10, 35)):
@@ -352,6 +281,10 @@ def test_a_hundred_plus_records(postgres_server, map_id):
 
     compare(records, tribe_records)
 
+    sampler.stop()
+    growth = sampler.growth('rss_bytes')
+    assert growth is None or growth < RSS_GROWTH_LIMIT, sampler.summary()
+
 
 def test_two_sequential_tribes_records(postgres_server, map_id):
     red_foxes = Tribe(postgres_server, map_id, num_of_players=50, prefix='Red fox')
@@ -1,5 +1,4 @@
 import os
-import time
 import pytest
 from pathlib import Path
 from collections import defaultdict
@@ -11,6 +10,8 @@ import docker
 from contextlib import contextmanager
 
 import conftest as utils
+import isolation
+from cpp_server_api import wait_for_server
 
 client = docker.from_env()
 
@@ -35,7 +36,9 @@ def remove_state_file(state):
 def run_server(state, remove_state=False):
     server_domain = os.environ.get('SERVER_DOMAIN', '127.0.0.1')
     server_port = os.environ.get('SERVER_PORT', '8080')
-    docker_network = os.environ.get('DOCKER_NETWORK')
+    # Порт на хосте выбирает докер, если он не задан явно, чтобы параллельные тесты не пересекались
+    host_port = os.environ.get('SERVER_HOST_PORT')
+    docker_network = isolation.worker_network(client)
 
     entrypoint = [
         "/app/game_server",
@@ -48,26 +51,24 @@ def run_server(state, remove_state=False):
         'detach': True,
         'entrypoint': entrypoint,
         'auto_remove': True,
-        'ports': {f"{server_port}/tcp": server_port},
+        'ports': {f"{server_port}/tcp": host_port},
         'volumes': {volume_path(): {'bind': '/tmp/volume', 'mode': 'rw'}},
     }
     if docker_network:
         kwargs['network'] = docker_network
     if server_domain != '127.0.0.1':
-        kwargs['name'] = server_domain
-    container = client.containers.run(
+        server_domain = kwargs['name'] = isolation.unique_name(server_domain)
+    container = isolation.run_container(
+        client,
         get_image_name(),
         **kwargs
     )
 
-    for i in range(2000):
-        log = container.logs().decode('utf-8')
-        if log.find('server started') != -1:
-            break
-        time.sleep(0.001)
-
+    if server_domain == '127.0.0.1':
+        server_port = isolation.published_port(container, f'{server_port}/tcp')
     # server = utils.Server(f'http://{server_domain}:{server_port}/')
     server = utils.Server(server_domain, server_port)
+    wait_for_server(server.url, container, 'server started', utils.get_readiness(), utils.get_probe_endpoint())
 
     try:
         yield server, container
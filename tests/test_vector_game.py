@@ -0,0 +1,90 @@
+import json
+import random
+
+from pathlib import Path
+
+import pytest
+
+from game_server import GameServer, GameSession, Point, RoadLoader
+
+pytest.importorskip('numpy')
+from vector_game import VectorGameServer, VectorSession   # Импортирует numpy
+
+
+DIRECTIONS = ['L', 'R', 'U', 'D', '']
+TICKS = [0, 1, 7, 100, 1000, 3000, 60000]
+
+
+def random_roads(rnd: random.Random, count: int) -> list:
+    roads = list()
+    for _ in range(count):
+        x, y = rnd.randint(-50, 100), rnd.randint(-50, 100)
+        if rnd.random() < 0.5:
+            roads.append({'x0': x, 'y0': y, 'x1': x + rnd.randint(-20, 20)})
+        else:
+            roads.append({'x0': x, 'y0': y, 'y1': y + rnd.randint(-20, 20)})
+    return roads
+
+
+def play(session_class, roads: list, speed, dogs: int, steps: int, seed: int) -> list:
+    """
+    States of the session after every tick, both engines get the same dogs, turns and ticks from the seed
+    """
+    rnd = random.Random(seed)
+    session = session_class({'id': 'map1', 'roads': roads, 'dogSpeed': speed}, 1.0)
+    prepared = RoadLoader(roads).get_dicts()
+    for i in range(dogs):
+        road = rnd.choice(prepared)
+        # Собаки на концах, в серединах и у краёв дорог
+        x = float(rnd.choice([road['x0'], road['x1'], (road['x0'] + road['x1']) / 2, road['x0'] + 0.4]))
+        y = float(rnd.choice([road['y0'], road['y1'], (road['y0'] + road['y1']) / 2]))
+        if rnd.random() < 0.5:
+            y = float(road['y0'])
+        else:
+            x = float(road['x0'])
+        session.add_player(f'Dog {i}', f'{i:032x}', i, Point(x, y))
+
+    states = list()
+    for _ in range(steps):
+        for player in session.players:
+            if rnd.random() < 0.3:
+                player.set_speed(rnd.choice(DIRECTIONS), session.default_speed)
+        session.tick(rnd.choice(TICKS))
+        states.append(json.dumps(session.get_state()))
+    return states
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_maps_same_state(seed):
+    rnd = random.Random(seed)
+    roads = random_roads(rnd, rnd.choice([1, 4, 40, 300]))
+    speed = rnd.choice([3, 3.0, 0.5, 1.7, 0.0])
+
+    assert play(VectorSession, roads, speed, 300, 30, seed) == play(GameSession, roads, speed, 300, 30, seed)
+
+
+def test_ten_thousand_dogs_same_state():
+    roads = [{'x0': x, 'y0': 0, 'y1': 1000} for x in range(0, 1000, 10)]
+    roads += [{'x0': 0, 'y0': y, 'x1': 1000} for y in range(0, 1000, 10)]
+
+    assert play(VectorSession, roads, 3.0, 10000, 5, 1) == play(GameSession, roads, 3.0, 10000, 5, 1)
+
+
+def test_servers_same_state(tmp_path: Path):
+    # Целая скорость в конфиге: в JSON состояния обе модели пишут 2.0
+    roads = [{'x0': x, 'y0': 0, 'y1': 500} for x in range(0, 500, 10)] + [{'x0': 0, 'y0': 0, 'x1': 500}]
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'defaultDogSpeed': 2, 'maps': [{'id': 'map1', 'name': 'Map 1', 'roads': roads}]}))
+
+    states = list()
+    for server in (GameServer(config), VectorGameServer(config)):
+        for i in range(50):
+            server.join(f'Dog {i}', 'map1', f'{i:032x}', i, Point(float(i * 10 % 500), 0.0))
+        for i in range(50):
+            server.move(f'{i:032x}', 'DRUL'[i % 4])
+        server.tick(1234)
+        server.move(f'{3:032x}', 'L')
+        server.tick(99)
+        states.append(json.dumps(server.get_state(f'{1:032x}')))
+
+    assert states[0] == states[1]
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+from async_cpp_server_api import AsyncCppServer
+
+
+# Эти заголовки пересчитываются при воспроизведении
+SKIPPED_HEADERS = {'host', 'content-length', 'connection'}
+JOIN_ENDPOINT = '/api/v1/game/join'
+
+
+def token_of(headers: dict) -> Optional[str]:
+    for key, value in headers.items():
+        if key.lower() == 'authorization' and value.startswith('Bearer '):
+            return value[len('Bearer '):]
+    return None
+
+
+class TrafficRecorder:
+    """
+    Appends every request of a server session to a JSON lines file: relative time, method, path, headers, body,
+    response status and the token issued by the join request
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__file = open(self.path, 'a', buffering=1)
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic()
+
+    def record(self, method: str, path: str, headers: dict, body: Union[bytes, str, None], status: Union[int, str],
+               sent_at: float, issued_token: Optional[str] = None):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='surrogateescape')
+        item = {
+            't': round(sent_at - self.__start, 6),
+            'm': method,
+            'p': path,
+            'h': {key: value for key, value in headers.items() if key.lower() not in SKIPPED_HEADERS},
+            'b': body or '',
+            's': status,
+        }
+        if issued_token is not None:
+            item['tok'] = issued_token
+        line = json.dumps(item, separators=(',', ':'))
+        with self.__lock:
+            self.__file.write(line + '\n')
+
+    def record_response(self, res, sent_at: float):
+        """
+        Records the request the response (requests.Response or raw_http.RawResponse) answers
+        """
+        req = res.request
+        path = urlsplit(req.url)
+        path = path.path + (f'?{path.query}' if path.query else '')
+
+        issued_token = None
+        if path == JOIN_ENDPOINT and res.status_code == 200:
+            try:
+                issued_token = res.json().get('authToken')
+            except (ValueError, AttributeError):
+                pass
+
+        self.record(req.method, path, dict(req.headers), req.body, res.status_code, sent_at, issued_token)
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+def load(path: Union[str, Path]) -> List[dict]:
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda item: item['t'])
+    return records
+
+
+async def replay_async(records: List[dict], url: str, speed: Optional[float] = 1.0,
+                       max_connections: int = 256) -> dict:
+    """
+    Sends the recorded requests to the server. With speed N the recorded pauses are N times shorter, speed None sends
+    as fast as possible. Requests of one token keep their order, tokens issued by the replayed joins replace the
+    recorded ones
+    """
+    parts = urlsplit(url)
+    lanes: Dict[Optional[str], List[dict]] = defaultdict(list)
+    issued = {item['tok'] for item in records if 'tok' in item}
+    for item in records:
+        lanes[token_of(item['h'])].append(item)
+
+    tokens: Dict[str, str] = dict()
+    token_ready: Dict[str, asyncio.Event] = {token: asyncio.Event() for token in issued}
+    statuses = Counter()
+    mismatches = Counter()
+
+    async with AsyncCppServer(parts.hostname, parts.port or 80, max_connections) as server:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def run_lane(recorded_token: Optional[str], items: List[dict]):
+            if recorded_token in token_ready:
+                await token_ready[recorded_token].wait()
+            for item in items:
+                if speed:
+                    delay = start + item['t'] / speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                headers = dict(item['h'])
+                if recorded_token is not None:
+                    headers = {key: (f'Bearer {tokens.get(recorded_token, recorded_token)}'
+                                     if key.lower() == 'authorization' else value)
+                               for key, value in headers.items()}
+                body = item['b'].encode('utf-8', errors='surrogateescape') if item['b'] else None
+
+                try:
+                    res = await server.request(item['m'], headers, item['p'], data=body)
+                    status = res.status_code
+                except (ConnectionError, OSError):
+                    res = None
+                    status = 'error'
+
+                statuses[status] += 1
+                if status != item['s']:
+                    mismatches[f'{item["m"]} {item["p"]}: {item["s"]} -> {status}'] += 1
+
+                if 'tok' in item:
+                    if res is not None and status == 200:
+                        tokens[item['tok']] = res.json().get('authToken', item['tok'])
+                    token_ready[item['tok']].set()
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(run_lane(token, items) for token, items in lanes.items()))
+        elapsed = time.perf_counter() - begin
+
+    return {
+        'requests': len(records),
+        'elapsed': elapsed,
+        'rps': len(records) / elapsed if elapsed else None,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'mismatches': dict(mismatches),
+    }
+
+
+def replay(path: Union[str, Path], url: str, speed: Optional[float] = 1.0, max_connections: int = 256) -> dict:
+    return asyncio.run(replay_async(load(path), url, speed, max_connections))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replays a recorded CppServer session against a server')
+    parser.add_argument('recording', type=Path)
+    parser.add_argument('url', help='Server url, e.g. http://127.0.0.1:8080')
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument('--speed', type=float, default=1.0, help='Replay N times faster than recorded')
+    speed.add_argument('--max-speed', action='store_true', help='Send the requests without pauses')
+    parser.add_argument('--connections', type=int, default=256)
+    args = parser.parse_args(argv)
+
+    report = replay(args.recording, args.url, None if args.max_speed else args.speed, args.connections)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import logging
+
+from typing import List, Optional
+
+import numpy as np
+
+from game_server import Direction, GameServer, GameSession, Point, Vector2D, get_speed
+
+
+DIRECTIONS = list(Direction)
+REL_TOL = 1e-9  # math.isclose по умолчанию
+
+
+class VectorPlayer:
+    """
+    A player of VectorSession: its position, speed and direction live in the arrays of the session, so a tick
+    doesn't touch the players at all. Behaves like game_server.Player for GameServer
+    """
+
+    __slots__ = ('session', 'index', 'name', 'token', 'id')
+
+    def __init__(self, session, index: int, name: str, token: str, id: int):
+        self.session = session
+        self.index = index
+        self.name = name
+        self.token = token
+        self.id = id
+
+    @property
+    def position(self) -> Point:
+        x, y = self.session.positions[self.index].tolist()
+        return Point(x, y)
+
+    @property
+    def speed(self) -> Vector2D:
+        x, y = self.session.speeds[self.index].tolist()
+        return Vector2D(x, y)
+
+    @property
+    def direction(self) -> Direction:
+        return DIRECTIONS[self.session.directions[self.index]]
+
+    def set_speed(self, direction: str, speed: float):
+        new_speed = get_speed(direction, speed)
+        self.session.speeds[self.index] = (new_speed.x, new_speed.y)
+        try:
+            self.session.directions[self.index] = DIRECTIONS.index(Direction[direction])
+        except KeyError:
+            pass    # leave the direction unchanged
+
+    def set_position(self, position: Point):
+        self.session.positions[self.index] = (position.x, position.y)
+
+    def get_state(self) -> Optional[dict]:
+        return {'pos': self.position.to_list(), 'speed': self.speed.to_list(), 'dir': str(self.direction)}
+
+
+class VectorSession(GameSession):
+    """
+    GameSession with the tick done by NumPy for all the players at once. The results are the same floats as of
+    GameSession.tick: the same operations in the same order, math.isclose and the first farthest road of
+    bounded_move are replicated. The only difference is a player off the roads, who stops in place instead of failing
+    """
+
+    def __init__(self, game_map: dict, default_speed):
+        super().__init__(game_map, default_speed)
+        self.players: List[VectorPlayer] = list()
+        self.positions = np.zeros((0, 2))
+        self.speeds = np.zeros((0, 2))
+        self.directions = np.zeros(0, dtype=np.int8)
+        self.__build_cells()
+
+    def __build_cells(self):
+        """
+        Unit cells of the map with the roads crossing them, in the order of self.roads. Cells are found by
+        searchsorted over their sorted keys, the roads of a cell are a row of self.cell_roads padded with -1
+        """
+        count = len(self.roads)
+        self.road_lo = np.array([[r.left_bottom_corner.x, r.left_bottom_corner.y] for r in self.roads]).reshape(-1, 2)
+        self.road_hi = np.array([[r.right_top_corner.x, r.right_top_corner.y] for r in self.roads]).reshape(-1, 2)
+        if count == 0:
+            self.origin, self.span = np.zeros(2, dtype=np.int64), 1
+            self.cell_keys = np.zeros(0, dtype=np.int64)
+            self.cell_roads = np.full((0, 1), -1)
+            return
+
+        first = np.floor(self.road_lo).astype(np.int64)
+        last = np.floor(self.road_hi).astype(np.int64)
+        self.origin = first.min(axis=0)
+        self.span = int(last[:, 1].max() - self.origin[1] + 1)
+
+        sizes = last - first + 1
+        cells = sizes[:, 0] * sizes[:, 1]
+        road = np.repeat(np.arange(count), cells)
+        local = np.arange(cells.sum()) - np.repeat(np.cumsum(cells) - cells, cells)
+        x = first[road, 0] + local // sizes[road, 1] - self.origin[0]
+        y = first[road, 1] + local % sizes[road, 1] - self.origin[1]
+        keys = x * self.span + y
+
+        order = np.lexsort((road, keys))
+        keys, road = keys[order], road[order]
+        self.cell_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        self.cell_roads = np.full((len(self.cell_keys), counts.max()), -1)
+        columns = np.arange(len(keys)) - np.repeat(starts, counts)
+        self.cell_roads[np.repeat(np.arange(len(counts)), counts), columns] = road
+
+    def add_player(self, name: str, token: str, _id: int, position: Point) -> VectorPlayer:
+        index = len(self.players)
+        if index == len(self.positions):
+            capacity = max(16, 2 * index)
+            self.positions = np.resize(self.positions, (capacity, 2))
+            self.speeds = np.resize(self.speeds, (capacity, 2))
+            self.directions = np.resize(self.directions, capacity)
+        self.positions[index] = (position.x, position.y)
+        self.speeds[index] = (0.0, 0.0)
+        self.directions[index] = DIRECTIONS.index(Direction.U)
+        player = VectorPlayer(self, index, name, token, _id)
+        self.players.append(player)
+        return player
+
+    def get_state(self) -> Optional[dict]:
+        count = len(self.players)
+        positions = self.positions[:count].tolist()
+        speeds = self.speeds[:count].tolist()
+        names = [str(direction) for direction in DIRECTIONS]
+        state = dict()
+        for player, position, speed, direction in zip(self.players, positions, speeds, self.directions[:count]):
+            state[str(player.id)] = {'pos': position, 'speed': speed, 'dir': names[direction]}
+        return {'players': state}
+
+    def candidate_roads(self, positions: np.ndarray) -> np.ndarray:
+        """
+        The roads of the cells of the positions, -1 for none
+        """
+        cells = np.floor(positions).astype(np.int64) - self.origin
+        inside = (cells >= 0).all(axis=1) & (cells[:, 1] < self.span)
+        keys = cells[:, 0] * self.span + cells[:, 1]
+        found = np.minimum(np.searchsorted(self.cell_keys, keys), max(len(self.cell_keys) - 1, 0))
+        inside &= len(self.cell_keys) > 0
+        inside[inside] &= self.cell_keys[found[inside]] == keys[inside]
+
+        roads = np.full((len(positions), self.cell_roads.shape[1]), -1)
+        roads[inside] = self.cell_roads[found[inside]]
+        return roads
+
+    @staticmethod
+    def isclose(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        difference = np.abs(a - b)
+        close = (difference <= np.abs(REL_TOL * b)) | (difference <= np.abs(REL_TOL * a))
+        return (a == b) | (np.isfinite(a) & np.isfinite(b) & close)
+
+    def tick(self, ticks: int):
+        count = len(self.players)
+        if count == 0:
+            return
+        positions = self.positions[:count]
+        speeds = self.speeds[:count]
+        estimated = positions + speeds * (ticks / 1000)
+
+        roads = self.candidate_roads(positions)
+        valid = roads >= 0
+        lo, hi = self.road_lo[roads], self.road_hi[roads]
+        start = positions[:, np.newaxis, :]
+        valid &= ((lo <= start) & (start <= hi)).all(axis=2)
+
+        # bound(): min с верхней границей, затем max с нижней
+        bounded = np.maximum(lo, np.minimum(hi, estimated[:, np.newaxis, :]))
+        distances = np.sqrt(((bounded - start) ** 2).sum(axis=2))
+        distances[~valid] = -np.inf
+        # argmax берёт первый максимум, как и строгое сравнение в bounded_move
+        best = np.argmax(distances, axis=1)
+        on_road = valid.any(axis=1)
+        if not on_road.all():
+            for i in np.flatnonzero(~on_road):
+                logging.warning("Player is not on the road. Position: %s, Map: %s",
+                                str(self.players[i].position), self.map['id'])
+
+        new_positions = np.where(on_road[:, np.newaxis], bounded[np.arange(count), best], positions)
+        moved = on_road & self.isclose(new_positions, estimated).all(axis=1)
+        positions[:] = new_positions
+        speeds[~moved] = 0.0
+
+
+class VectorGameServer(GameServer):
+    """
+    GameServer with the sessions ticked by NumPy, for differential checks with thousands of dogs per map
+    """
+    session_class = VectorSession
@@ -0,0 +1,270 @@
+import argparse
+import random
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+import raw_http
+
+from cpp_server_api import CppServer
+from game_server import Direction
+from latency import LatencyRecorder
+
+
+# Виды действий собаки и их доля по умолчанию
+DEFAULT_MIX = {'turn': 4, 'stop': 1, 'state': 4, 'records': 1}
+RECORDS_ENDPOINT = '/api/v1/game/records'
+TICK_ACTION = 'tick'
+
+
+@dataclass
+class Player:
+
+    name: str
+    token: str
+    player_id: int
+    score: float = 0
+    playing_time: float = 0.0
+
+    def add_time(self, time_to_add: float):
+        self.playing_time += time_to_add
+
+    def get_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "score": self.score,
+            "playTime": self.playing_time
+        }
+
+    def update_score(self, server):
+        state = server.get_player_state(self.token, self.player_id)
+        self.score = state['score']
+
+
+class Tribe:
+
+    def __init__(self, server, map_id: str, num_of_players: int = 10, prefix: str = 'Player'):
+        self.server: CppServer = server
+        self.players: List[Player] = list()
+        names = [f'{prefix} {i}' for i in range(0, num_of_players)]
+        for name, (token, player_id) in zip(names, server.join_many(names, map_id)):
+            self.players.append(Player(name, token, player_id))
+
+    def __getitem__(self, index: int) -> Player:
+        return self.players[index]
+
+    def __len__(self):
+        return len(self.players)
+
+    def add_time(self, time_to_add: float):
+        for pl in self.players:
+            pl.add_time(time_to_add)
+
+    def get_list(self) -> list:
+        self.players.sort(key=lambda x: x.score, reverse=True)
+        res = [pl.get_dict() for pl in self.players]
+
+        return res
+
+    def update_scores(self):
+        states = self.server.states_many([pl.token for pl in self.players], [pl.player_id for pl in self.players])
+        for player, state in zip(self.players, states):
+            player.score = state['score']
+
+    def randomized_turn(self):
+        directions = [Direction.random_str() for _ in self.players]
+        self.server.move_many([pl.token for pl in self.players], directions)
+
+    def randomized_move(self, retirement_time: float):
+        self.randomized_turn()
+        ticks = random.randint(100, min(10000, int(retirement_time*900)))
+        seconds = ticks / 1000
+        self.add_time(seconds)
+        self.server.tick(ticks)
+
+    def stop(self):
+        self.server.move_many([pl.token for pl in self.players], '')
+
+
+def parse_think_time(spec: str) -> Callable[[random.Random], float]:
+    """
+    Think time distribution in seconds: "0.1" or "const:0.1", "exp:0.1" (mean), "uniform:0.05,0.2".
+    The mean of the distribution is kept in the mean attribute of the result
+    """
+    kind, _, args = spec.partition(':')
+    if not args:
+        kind, args = 'const', kind
+    values = [float(value) for value in args.split(',')]
+
+    if kind == 'const':
+        sample, mean = (lambda rnd: values[0]), values[0]
+    elif kind == 'exp':
+        sample, mean = (lambda rnd: rnd.expovariate(1 / values[0]) if values[0] > 0 else 0.0), values[0]
+    elif kind == 'uniform':
+        sample, mean = (lambda rnd: rnd.uniform(values[0], values[1])), (values[0] + values[1]) / 2
+    else:
+        raise ValueError(f'Unknown think time distribution {kind}, expected const, exp or uniform')
+    sample.mean = mean
+    return sample
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parses a mix like "turn=4,stop=1,state=4,records=1"
+    """
+    result = dict()
+    for item in mix.split(','):
+        action, _, weight = item.partition('=')
+        action = action.strip()
+        if action not in DEFAULT_MIX:
+            raise ValueError(f'Unknown action {action}, expected one of {list(DEFAULT_MIX)}')
+        result[action] = float(weight or 1)
+    return result
+
+
+class DogSimulator:
+    """
+    Closed-loop game-shaped load: every virtual dog waits for the answer, thinks and does the next action of the mix,
+    while a ticker thread advances the game time. Latency of every action is kept in a per-action histogram
+    """
+
+    def __init__(self, server: CppServer, map_ids: Sequence[str], dogs_per_map: int = 10,
+                 think_time: Callable[[random.Random], float] = parse_think_time('exp:0.1'),
+                 mix: Optional[Dict[str, float]] = None, tick_period: Optional[float] = 0.1,
+                 seed: Optional[int] = None):
+        self.server = server
+        self.think_time = think_time
+        self.mix = {action: weight for action, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+        self.tick_period = tick_period
+        self.seed = seed
+        self.recorder = LatencyRecorder()
+        self.tribes = [Tribe(server, map_id, dogs_per_map, prefix=f'Dog {map_id}') for map_id in map_ids]
+        self.__stopped = threading.Event()
+
+    def __timed(self, action: str, call: Callable, expected_interval: Optional[float] = None):
+        start = time.perf_counter()
+        try:
+            call()
+            status = 200
+        except Exception as ex:    # Собака не должна умирать из-за ошибки сервера, ошибка попадёт в отчёт
+            status = type(ex).__name__
+        self.recorder.record(action, status, time.perf_counter() - start, expected_interval)
+
+    def __read_records(self, rnd: random.Random):
+        res = self.server.send('GET', RECORDS_ENDPOINT, params={'start': 0, 'maxItems': rnd.randint(1, 100)})
+        CppServer.validate_response(res)
+
+    def __act(self, dog: Player, action: str, rnd: random.Random):
+        if action == 'turn':
+            self.server.move(dog.token, Direction.random_str())
+        elif action == 'stop':
+            self.server.move(dog.token, '')
+        elif action == 'state':
+            state = self.server.get_player_state(dog.token, dog.player_id)
+            dog.score = state.get('score', dog.score)   # До 4 спринта очков в состоянии нет
+        elif action == 'records':
+            self.__read_records(rnd)
+
+    def __live(self, dog: Player, rnd: random.Random):
+        actions = list(self.mix)
+        weights = [self.mix[action] for action in actions]
+        # Пока собака ждёт ответа, она не делает ходов, которые сделала бы в среднем раз в think_time.
+        # Случайная пауза не годится: короткая выборка превращала бы любой медленный ответ в пропущенные ходы
+        expected_interval = getattr(self.think_time, 'mean', None)
+        while not self.__stopped.is_set():
+            action = rnd.choices(actions, weights)[0]
+            self.__timed(action, lambda: self.__act(dog, action, rnd), expected_interval)
+            self.__stopped.wait(self.think_time(rnd))
+
+    def __tick(self):
+        ticks = int(self.tick_period * 1000)
+        next_tick = time.monotonic()
+        while not self.__stopped.is_set():
+            self.__timed(TICK_ACTION, lambda: self.server.tick(ticks), self.tick_period)
+            for tribe in self.tribes:
+                tribe.add_time(self.tick_period)
+            next_tick += self.tick_period
+            self.__stopped.wait(max(0.0, next_tick - time.monotonic()))
+
+    def run(self, duration: float) -> dict:
+        self.__stopped.clear()
+        self.recorder.clear()
+        seeds = random.Random(self.seed)
+        threads = [threading.Thread(target=self.__live, args=(dog, random.Random(seeds.random())), daemon=True)
+                   for tribe in self.tribes for dog in tribe]
+        if self.tick_period:
+            threads.append(threading.Thread(target=self.__tick, daemon=True))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        self.__stopped.wait(duration)
+        self.__stopped.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        actions = dict()
+        for (action, status), histogram in sorted(self.recorder.histograms.items()):
+            item = actions.setdefault(action, {'count': 0, 'errors': dict()})
+            item['count'] += histogram.total
+            if status != '200':
+                item['errors'][status] = histogram.total
+                continue
+            item.update({
+                'p50 ms': histogram.percentile(50) / 1000,
+                'p90 ms': histogram.percentile(90) / 1000,
+                'p99 ms': histogram.percentile(99) / 1000,
+                'max ms': histogram.max / 1000,
+            })
+            corrected = self.recorder.corrected.get((action, status))
+            if corrected is not None:
+                item.update({
+                    'corrected p50 ms': corrected.percentile(50) / 1000,
+                    'corrected p90 ms': corrected.percentile(90) / 1000,
+                    'corrected p99 ms': corrected.percentile(99) / 1000,
+                })
+        for item in actions.values():
+            item['rps'] = item['count'] / elapsed if elapsed else None
+
+        return {
+            'elapsed': elapsed,
+            'dogs': sum(len(tribe) for tribe in self.tribes),
+            'rps': sum(item['count'] for item in actions.values()) / elapsed if elapsed else None,
+            'actions': actions,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs virtual dogs against a game server')
+    parser.add_argument('url', help='Server url, e.g. http://127.0.0.1:8080')
+    parser.add_argument('--maps', nargs='*', help='Maps to play on, all the maps of the server by default')
+    parser.add_argument('--dogs', type=int, default=10, help='Dogs per map')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to play')
+    parser.add_argument('--think', type=parse_think_time, default=parse_think_time('exp:0.1'),
+                        help='Think time between the actions: const:S, exp:MEAN or uniform:MIN,MAX')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Weights of the actions, e.g. "turn=4,stop=1,state=4,records=1"')
+    parser.add_argument('--tick-period', type=float, default=0.1,
+                        help='Seconds between the tick requests, 0 for a server with its own ticker')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    host, port = raw_http.split_url(args.url)
+    server = CppServer(host, port)
+    map_ids = args.maps or [m['id'] for m in server.get_maps()]
+    simulator = DogSimulator(server, map_ids, args.dogs, args.think, args.mix, args.tick_period, args.seed)
+
+    report = simulator.run(args.duration)
+    print(f'{report["dogs"]} dogs, {report["rps"]:.1f} requests per second')
+    for line in simulator.recorder.summary():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()